@@ -0,0 +1,287 @@
+import atexit
+import bisect
+import heapq
+import sqlite3
+import threading
+import time
+import traceback
+
+import streamlit as st
+
+from db import open_connection, read_sql
+from suggest import MIN_PREFIX, title_words
+
+# Журнал поиска: что ищут, какие запросы ничего не находят и какие вопросы
+# открывают из результатов. Поиск только кладёт событие в буфер в памяти;
+# фоновый поток пишет буфер в базу пачками и периодически сводит новые
+# события в таблицы статистики. Из сводки берутся популярные запросы для
+# подсказок под полем поиска и отчёт для админа.
+#
+# Запись идёт отдельным соединением мимо очереди записи: поколение данных
+# не меняется, кэши вопросов не сбрасываются. Несколько процессов на одной
+# базе сводят события по очереди (BEGIN IMMEDIATE), каждое — один раз.
+
+# Как часто писать буфер в базу, с, и сколько событий ждать не дольше этого
+FLUSH_INTERVAL = 2
+FLUSH_SIZE = 500
+
+# Сколько событий держать в памяти, если база недоступна (старые отбрасываются)
+MAX_BUFFERED = 50000
+
+# Как часто сводить события в статистику, с
+AGGREGATE_INTERVAL = 60
+
+# Сколько дней хранить сырые события (сводка хранится всё время)
+LOG_RETENTION_DAYS = 90
+
+# Длина запроса в журнале
+QUERY_LENGTH = 200
+
+# Популярные запросы для подсказок: сколько держать в памяти
+# и сколько раз запрос должен был что-то найти
+POPULAR_KEPT = 5000
+POPULAR_MIN_SEARCHES = 2
+POPULAR_LIMIT = 3
+
+# Строк в каждой таблице отчёта
+REPORT_ROWS = 50
+
+# Ключ сводки: слова запроса в нижнем регистре через пробел
+def normalize_query(text):
+    return " ".join(title_words(text))[:QUERY_LENGTH]
+
+# Время в формате CURRENT_TIMESTAMP (UTC), как у остальных таблиц
+def _timestamp():
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+class SearchLog:
+    def __init__(self, conn):
+        self._conn = conn
+        self._conn_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._events = []
+        self._clicks = []
+        self.dropped = 0
+        # Запросы отсортированы (поиск по префиксу через bisect), рядом — число поисков
+        self._popular = ([], [])
+        self._aggregated_at = 0.0
+        self._stop = False
+        self._wake = threading.Event()
+        self.load_popular()
+        self._thread = threading.Thread(target=self._run, name="knowledge-search-log", daemon=True)
+        self._thread.start()
+
+    # ----- Запись (путь запроса: только буфер) -----
+    def _buffer(self, items, item):
+        with self._lock:
+            items.append(item)
+            full = len(self._events) + len(self._clicks) >= FLUSH_SIZE
+        if full:
+            self._wake.set()
+
+    def record_search(self, text, kind, results):
+        query = normalize_query(text)
+        if query:
+            self._buffer(self._events, (_timestamp(), query, kind, results))
+
+    def record_click(self, text, question_id):
+        query = normalize_query(text)
+        if query:
+            self._buffer(self._clicks, (_timestamp(), query, question_id))
+
+    # ----- Фоновый поток -----
+    def _run(self):
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            stop = self._stop
+            try:
+                self.flush()
+                if not stop and time.monotonic() - self._aggregated_at >= AGGREGATE_INTERVAL:
+                    self.aggregate()
+            except Exception:
+                # Поток журнала не должен умирать из-за недоступной базы
+                traceback.print_exc()
+            if stop:
+                return
+
+    # Дописать буфер и остановить поток
+    def close(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+            clicks, self._clicks = self._clicks, []
+        if not events and not clicks:
+            return
+        try:
+            with self._conn_lock, self._conn:
+                self._conn.executemany(
+                    "INSERT INTO search_events (searched_at, query, kind, results) VALUES (?, ?, ?, ?)", events)
+                self._conn.executemany(
+                    "INSERT INTO search_clicks (clicked_at, query, question_id) VALUES (?, ?, ?)", clicks)
+        except sqlite3.Error:
+            # Вернуть события в начало буфера до следующей попытки
+            with self._lock:
+                self._events[:0] = events
+                self._clicks[:0] = clicks
+                for items in (self._events, self._clicks):
+                    overflow = len(items) - MAX_BUFFERED
+                    if overflow > 0:
+                        del items[:overflow]
+                        self.dropped += overflow
+            raise
+
+    # Новые события (после отметки в search_log_state) добавляются к сводке,
+    # старые сырые события удаляются
+    def aggregate(self):
+        with self._conn_lock, self._conn:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            params = dict(zip(("events_from", "clicks_from"),
+                              conn.execute("SELECT events_id, clicks_id FROM search_log_state").fetchone()))
+            params["events_to"] = conn.execute("SELECT COALESCE(MAX(id), 0) FROM search_events").fetchone()[0]
+            params["clicks_to"] = conn.execute("SELECT COALESCE(MAX(id), 0) FROM search_clicks").fetchone()[0]
+            params["retention"] = f"-{LOG_RETENTION_DAYS} days"
+
+            conn.execute("""
+                INSERT INTO search_query_stats (query, searches, empty_searches, last_searched_at)
+                SELECT query, COUNT(*), SUM(results = 0), MAX(searched_at)
+                FROM search_events
+                WHERE id > :events_from AND id <= :events_to
+                GROUP BY query
+                ON CONFLICT (query) DO UPDATE SET
+                    searches = searches + excluded.searches,
+                    empty_searches = empty_searches + excluded.empty_searches,
+                    last_searched_at = MAX(last_searched_at, excluded.last_searched_at)
+            """, params)
+            conn.execute("""
+                INSERT INTO search_query_stats (query, clicks)
+                SELECT query, COUNT(*)
+                FROM search_clicks
+                WHERE id > :clicks_from AND id <= :clicks_to
+                GROUP BY query
+                ON CONFLICT (query) DO UPDATE SET clicks = clicks + excluded.clicks
+            """, params)
+            conn.execute("""
+                INSERT INTO search_click_stats (query, question_id, clicks)
+                SELECT query, question_id, COUNT(*)
+                FROM search_clicks
+                WHERE id > :clicks_from AND id <= :clicks_to
+                GROUP BY query, question_id
+                ON CONFLICT (query, question_id) DO UPDATE SET clicks = clicks + excluded.clicks
+            """, params)
+            conn.execute("""
+                UPDATE search_log_state
+                SET events_id = :events_to, clicks_id = :clicks_to, aggregated_at = CURRENT_TIMESTAMP
+            """, params)
+
+            # Номера событий растут со временем: старые лежат в начале таблицы,
+            # и поиск первого свежего события просматривает только их
+            conn.execute("""
+                DELETE FROM search_events
+                WHERE id <= :events_to AND id < COALESCE(
+                    (SELECT id FROM search_events WHERE searched_at >= datetime('now', :retention)
+                     ORDER BY id LIMIT 1), :events_to + 1)
+            """, params)
+            conn.execute("""
+                DELETE FROM search_clicks
+                WHERE id <= :clicks_to AND id < COALESCE(
+                    (SELECT id FROM search_clicks WHERE clicked_at >= datetime('now', :retention)
+                     ORDER BY id LIMIT 1), :clicks_to + 1)
+            """, params)
+        self._aggregated_at = time.monotonic()
+        self.load_popular()
+
+    # Записать буфер и свести события сразу (кнопка в отчёте)
+    def refresh(self):
+        self.flush()
+        self.aggregate()
+
+    # ----- Популярные запросы -----
+    # Только запросы, которые что-то находили: подсказка не должна вести в пустоту
+    def load_popular(self):
+        with self._conn_lock:
+            rows = self._conn.execute("""
+                SELECT query, searches FROM search_query_stats
+                WHERE searches >= ? AND empty_searches < searches
+                ORDER BY searches DESC
+                LIMIT ?
+            """, (POPULAR_MIN_SEARCHES, POPULAR_KEPT)).fetchall()
+        rows.sort()
+        self._popular = ([query for query, _ in rows], [searches for _, searches in rows])
+
+    # Частые запросы, начинающиеся с набранного текста
+    def popular(self, text, limit=POPULAR_LIMIT):
+        prefix = normalize_query(text)
+        if len(prefix) < MIN_PREFIX:
+            return []
+        queries, searches = self._popular
+        start = bisect.bisect_left(queries, prefix)
+        end = bisect.bisect_left(queries, prefix + "\uffff", start)
+        rows = [row for row in range(start, end) if queries[row] != prefix]
+        return [queries[row] for row in heapq.nlargest(limit, rows, key=searches.__getitem__)]
+
+    # ----- Отчёт -----
+    def report(self):
+        with self._conn_lock:
+            totals = self._conn.execute("""
+                SELECT COALESCE(SUM(searches), 0), COALESCE(SUM(empty_searches), 0),
+                       COALESCE(SUM(clicks), 0), (SELECT aggregated_at FROM search_log_state)
+                FROM search_query_stats
+            """).fetchone()
+            top_queries = read_sql("""
+                SELECT query AS "Запрос", searches AS "Поисков",
+                       searches - empty_searches AS "С результатами",
+                       clicks AS "Открыто вопросов",
+                       ROUND(100.0 * clicks / MAX(searches, 1), 1) AS "CTR, %",
+                       last_searched_at AS "Последний поиск"
+                FROM search_query_stats
+                ORDER BY searches DESC
+                LIMIT ?
+            """, self._conn, (REPORT_ROWS,))
+            empty_queries = read_sql("""
+                SELECT query AS "Запрос", empty_searches AS "Без результатов",
+                       searches AS "Поисков", last_searched_at AS "Последний поиск"
+                FROM search_query_stats
+                WHERE empty_searches > 0
+                ORDER BY empty_searches DESC
+                LIMIT ?
+            """, self._conn, (REPORT_ROWS,))
+            top_questions = read_sql("""
+                SELECT q.id AS "№", substr(q.question, 1, 80) AS "Вопрос",
+                       SUM(c.clicks) AS "Открыто из поиска", COUNT(*) AS "Разных запросов"
+                FROM search_click_stats c
+                JOIN questions q ON q.id = c.question_id
+                GROUP BY c.question_id
+                ORDER BY SUM(c.clicks) DESC
+                LIMIT ?
+            """, self._conn, (REPORT_ROWS,))
+        searches, empty, clicks, aggregated_at = totals
+        return {
+            "searches": searches,
+            "empty": empty,
+            "clicks": clicks,
+            "aggregated_at": aggregated_at,
+            "top_queries": top_queries,
+            "empty_queries": empty_queries,
+            "top_questions": top_questions,
+        }
+
+@st.cache_resource
+def get_search_log():
+    search_log = SearchLog(open_connection())
+    atexit.register(search_log.close)
+    return search_log
+
+def record_search(text, kind, results):
+    get_search_log().record_search(text, kind, results)
+
+def record_click(text, question_id):
+    get_search_log().record_click(text, question_id)
+
+def popular_queries(text, limit=POPULAR_LIMIT):
+    return get_search_log().popular(text, limit)
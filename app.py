@@ -1,22 +1,31 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
 from datetime import datetime, timedelta
 import hashlib
-from contextlib import contextmanager
+
+from db import (
+    get_sections, get_sections_with_counts, get_section,
+    count_questions, get_questions_page, get_question, get_questions_by_ids, search_questions,
+    get_home_summary,
+    add_section, add_question, update_question, update_section,
+    delete_section, delete_question,
+)
+import backup
+import static_site
+import transfer
+from analytics import get_search_log, popular_queries, record_click, record_search
+from duplicates import duplicate_clusters, find_duplicates
+from metrics import get_metrics, METRICS_FILE
+from semantic import similar_questions
+from suggest import correct_query, suggest_questions
 
 # Настройка
 ADMIN_PASSWORD = "admin123"  # Измени на свой пароль
-DB_FILE = "knowledge.db"
-
-# Контекстный менеджер для работы с БД
-@contextmanager
-def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    try:
-        yield conn
-    finally:
-        conn.close()
+QUESTIONS_PAGE_SIZE = 20  # Вопросов на странице раздела по умолчанию
+PAGE_SIZE_OPTIONS = [10, 20, 50, 100]
+WRITE_TIMEOUT = 30  # Сколько ждать подтверждения записи, с
+SUGGESTIONS_SHOWN = 5  # Подсказок под полем поиска
+SEARCH_PAGE_SIZE = 20  # Результатов поиска на странице
+DUPLICATE_CLUSTERS_SHOWN = 50  # Групп дубликатов в отчёте
 
 # Хэширование пароля для сравнения
 def hash_password(password):
@@ -37,6 +46,78 @@ def format_datetime(timestamp):
     except:
         return timestamp
 
+# Ожидание операции из очереди записи; при ошибке показываем её и возвращаем False.
+# Не дождались — операция снимается с очереди; если она уже выполняется,
+# то сохранится, и повторять её не нужно
+def wait_for_write(future):
+    try:
+        future.result(timeout=WRITE_TIMEOUT)
+    except TimeoutError:
+        if future.cancel():
+            st.error("Не удалось сохранить изменения: очередь записи занята, попробуйте ещё раз")
+        else:
+            st.warning("Запись ещё выполняется — изменения появятся после обновления страницы")
+        return False
+    except Exception as error:
+        st.error(f"Не удалось сохранить изменения: {error}")
+        return False
+    return True
+
+# Запуск поиска из кода (подсказка, исправленный запрос): текст попадает
+# и в поле поиска — его значение меняется до того, как поле будет создано
+def start_search(text, open_question_id=None):
+    st.session_state["search_mode"] = True
+    st.session_state["search_text"] = text
+    st.session_state["last_search"] = text
+    st.session_state["pending_search_input"] = text
+    # Новый запрос — с первой страницы и по всем разделам
+    st.session_state.pop("search_offset", None)
+    st.session_state.pop("search_section", None)
+    st.session_state.pop("logged_search", None)
+    if open_question_id is not None:
+        st.session_state.setdefault("opened_questions", set()).add(int(open_question_id))
+    st.rerun()
+
+# Строка списка вопросов: в списке только заголовок, полный текст
+# загружается, когда пользователь раскрывает вопрос (тогда же вызывается on_open)
+def open_question(question_id, label, key, on_open=None):
+    question_id = int(question_id)
+    opened = st.session_state.setdefault("opened_questions", set())
+    is_open = question_id in opened
+    if st.button(f"{'▾' if is_open else '▸'} {label}", key=f"{key}_{question_id}", use_container_width=True):
+        opened ^= {question_id}
+        if not is_open and on_open is not None:
+            on_open()
+        st.rerun()
+    if not is_open:
+        return None
+    return get_question(question_id)
+
+# Похожие вопросы перед записью: предупреждение со ссылками на них и выбор,
+# сохранять ли всё равно. В st.session_state[pending] лежат аргументы save
+# и найденные дубликаты; возвращает True, когда запись сохранена.
+def duplicate_warning(pending, save):
+    fields, duplicates = st.session_state[pending]
+    similarity = dict(duplicates)
+    with st.container(border=True):
+        st.warning("⚠️ Похожий вопрос уже есть:")
+        for item in get_questions_by_ids(tuple(similarity)):
+            if st.button(f"📁 {item.section_title} » {item.title[:60]} — {similarity[item.id]:.0%}",
+                         key=f"{pending}_{item.id}", use_container_width=True):
+                del st.session_state[pending]
+                start_search(item.title.strip(), open_question_id=item.id)
+        col_save, col_cancel = st.columns(2)
+        with col_save:
+            if st.button("Всё равно сохранить", key=f"{pending}_save", use_container_width=True):
+                if wait_for_write(save(*fields)):
+                    del st.session_state[pending]
+                    return True
+        with col_cancel:
+            if st.button("Отмена", key=f"{pending}_cancel", use_container_width=True):
+                del st.session_state[pending]
+                st.rerun()
+    return False
+
 st.set_page_config(
     page_title="База знаний",
     page_icon="📚",
@@ -44,557 +125,814 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Инициализация состояния сессии
-if 'admin_logged_in' not in st.session_state:
-    st.session_state.admin_logged_in = False
-
-# Создание базы данных
-def init_db():
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS sections
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      title TEXT NOT NULL,
-                      description TEXT,
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS questions
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      section_id INTEGER,
-                      question TEXT NOT NULL,
-                      answer TEXT,
-                      info TEXT,
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                      FOREIGN KEY (section_id) REFERENCES sections (id))''')
-        conn.commit()
-
-init_db()
-
-# Функции для работы с БД
-@st.cache_data(ttl=300)  # Кэшируем на 5 минут
-def get_sections():
-    with get_db_connection() as conn:
-        return pd.read_sql("SELECT * FROM sections ORDER BY title", conn)
-
-def get_questions(section_id):
-    with get_db_connection() as conn:
-        return pd.read_sql("SELECT * FROM questions WHERE section_id = ? ORDER BY id", 
-                          conn, params=(section_id,))
-
-def search_questions(search_text):
-    with get_db_connection() as conn:
-        query = """
-        SELECT q.*, s.title as section_title 
-        FROM questions q
-        JOIN sections s ON q.section_id = s.id
-        WHERE q.question LIKE ? 
-           OR q.answer LIKE ?
-           OR q.info LIKE ?
-        ORDER BY s.title, q.id
-        """
-        search_param = f"%{search_text}%"
-        return pd.read_sql(query, conn, params=(search_param, search_param, search_param))
-
-@st.cache_data(ttl=300)
-def get_recent_sections(limit=5):
-    with get_db_connection() as conn:
-        return pd.read_sql(f"SELECT * FROM sections ORDER BY created_at DESC LIMIT {limit}", conn)
-
-@st.cache_data(ttl=300)
-def get_recent_questions(limit=5):
-    with get_db_connection() as conn:
-        query = f"""
-        SELECT q.*, s.title as section_title 
-        FROM questions q
-        JOIN sections s ON q.section_id = s.id
-        ORDER BY q.created_at DESC 
-        LIMIT {limit}
-        """
-        return pd.read_sql(query, conn)
-
-def get_total_stats():
-    with get_db_connection() as conn:
-        sections_count = pd.read_sql("SELECT COUNT(*) as count FROM sections", conn).iloc[0]['count']
-        questions_count = pd.read_sql("SELECT COUNT(*) as count FROM questions", conn).iloc[0]['count']
-        return sections_count, questions_count
-
-def add_section(title, description):
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute("INSERT INTO sections (title, description) VALUES (?, ?)", 
-                  (title, description))
-        conn.commit()
-
-def add_question(section_id, question, answer, info):
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute("INSERT INTO questions (section_id, question, answer, info) VALUES (?, ?, ?, ?)",
-                  (section_id, question, answer, info))
-        conn.commit()
-
-def update_question(question_id, question, answer, info):
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute("UPDATE questions SET question = ?, answer = ?, info = ? WHERE id = ?",
-                  (question, answer, info, question_id))
-        conn.commit()
+# Замер времени перезапуска скрипта. Завершается в finally: st.rerun()
+# прерывает скрипт исключением, а такие перезапуски тоже учитываются
+get_metrics().start_rerun()
+try:
+    # Резервные копии по расписанию (поток запускается один раз на процесс)
+    backup.get_backup_scheduler()
 
-def update_section(section_id, title, description):
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute("UPDATE sections SET title = ?, description = ? WHERE id = ?",
-                  (title, description, section_id))
-        conn.commit()
+    # Инициализация состояния сессии
+    if 'admin_logged_in' not in st.session_state:
+        st.session_state.admin_logged_in = False
 
-def delete_section(section_id):
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM sections WHERE id = ?", (section_id,))
-        c.execute("DELETE FROM questions WHERE section_id = ?", (section_id,))
-        conn.commit()
-
-def delete_question(question_id):
-    with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM questions WHERE id = ?", (question_id,))
-        conn.commit()
-
-# ===== БОКОВАЯ ПАНЕЛЬ =====
-with st.sidebar:
-    st.header("📚 База знаний")
-    
-    # Поиск - УПРОЩЕННАЯ ЛОГИКА
-    search_container = st.container()
-    
-    with search_container:
-        search_text = st.text_input(
-            "🔍 Поиск", 
-            placeholder="Введите запрос и нажмите Enter...",
-            value=st.session_state.get("search_text", ""),
-            key="search_input",
-            label_visibility="collapsed"
-        )
+    # ===== БОКОВАЯ ПАНЕЛЬ =====
+    with st.sidebar:
+        st.header("📚 База знаний")
+    
+        # Поиск - УПРОЩЕННАЯ ЛОГИКА
+        search_container = st.container()
+    
+        with search_container:
+            if "pending_search_input" in st.session_state:
+                st.session_state["search_input"] = st.session_state.pop("pending_search_input")
+            search_text = st.text_input(
+                "🔍 Поиск", 
+                placeholder="Введите запрос и нажмите Enter...",
+                key="search_input",
+                label_visibility="collapsed"
+            )
         
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            search_clicked = st.button("Найти", use_container_width=True, key="search_button")
-        with col2:
-            # Кнопка очистки поиска
-            if st.session_state.get("search_mode"):
-                if st.button("✖", use_container_width=True, key="clear_search"):
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                search_clicked = st.button("Найти", use_container_width=True, key="search_button")
+            with col2:
+                # Кнопка очистки поиска
+                if st.session_state.get("search_mode"):
+                    if st.button("✖", use_container_width=True, key="clear_search"):
+                        if "search_mode" in st.session_state:
+                            del st.session_state["search_mode"]
+                        if "search_text" in st.session_state:
+                            del st.session_state["search_text"]
+                        # Поле поиска тоже очищается, иначе под ним остаются подсказки
+                        st.session_state["pending_search_input"] = ""
+                        st.session_state.pop("last_search", None)
+                        st.rerun()
+    
+        # Обработка поиска - срабатывает при нажатии кнопки ИЛИ при вводе текста и нажатии Enter
+        if search_clicked or (search_text and search_text != st.session_state.get("last_search", "")):
+            if search_text.strip():
+                start_search(search_text)
+            elif search_clicked:  # Только если нажата кнопка (не Enter)
+                st.warning("Введите текст для поиска")
+    
+        # Подсказки: частые запросы других пользователей и заголовки вопросов
+        # для набранного текста (с учётом опечаток)
+        if search_text.strip():
+            for number, query in enumerate(popular_queries(search_text)):
+                if st.button(f"🔥 {query}", key=f"popular_{number}", use_container_width=True):
+                    start_search(query)
+            suggested = suggest_questions(search_text, SUGGESTIONS_SHOWN)
+            for item in get_questions_by_ids(tuple(question_id for question_id, _ in suggested)):
+                if st.button(f"💡 {item.title[:60]}", key=f"suggest_{item.id}", use_container_width=True):
+                    start_search(item.title.strip(), open_question_id=item.id)
+    
+        st.write("---")
+    
+        # Панель админа
+        if not st.session_state.admin_logged_in:
+            with st.form("admin_login"):
+                password = st.text_input("Пароль админа", type="password")
+                if st.form_submit_button("Войти как админ"):
+                    if hash_password(password) == ADMIN_PASSWORD_HASH:
+                        st.session_state.admin_logged_in = True
+                        st.rerun()
+                    else:
+                        st.error("Неверный пароль")
+        else:
+            st.success("✅ Админ")
+            st.toggle("📈 Метрики производительности", key="metrics_mode")
+            if st.button("Выйти", use_container_width=True):
+                st.session_state.admin_logged_in = False
+                st.rerun()
+    
+        st.write("---")
+        st.subheader("📂 Разделы")
+    
+        # Кнопка "Главная"
+        if st.button("🏠 Главная", use_container_width=True, key="main_button"):
+            # Очищаем все состояния связанные с поиском и разделами
+            for key in ["search_mode", "search_text", "last_search", "current_section", "section_title"]:
+                if key in st.session_state:
+                    del st.session_state[key]
+            st.session_state["pending_search_input"] = ""
+            st.rerun()
+    
+        # Получаем список разделов
+        sections = get_sections()
+    
+        if sections:
+            st.write("---")
+        
+            # Показываем разделы как кликабельные кнопки
+            for section in sections:
+                if st.button(f"📁 {section.title}", 
+                            use_container_width=True,
+                            key=f"nav_{section.id}"):
+                    # Выходим из режима поиска
                     if "search_mode" in st.session_state:
                         del st.session_state["search_mode"]
                     if "search_text" in st.session_state:
                         del st.session_state["search_text"]
+                    st.session_state["current_section"] = section.id
+                    st.session_state["section_title"] = section.title
                     st.rerun()
+        else:
+            st.info("Нет разделов")
+
+    # ===== ГЛАВНАЯ ОБЛАСТЬ =====
+    # Метрики производительности (только для админа)
+    if st.session_state.admin_logged_in and st.session_state.get("metrics_mode"):
+        metrics = get_metrics()
+        st.subheader("📈 Метрики производительности")
+        st.caption("Данные собираются со всех сессий с момента запуска процесса или последнего сброса.")
     
-    # Обработка поиска - срабатывает при нажатии кнопки ИЛИ при вводе текста и нажатии Enter
-    if search_clicked or (search_text and search_text != st.session_state.get("last_search", "")):
-        if search_text.strip():
-            st.session_state["search_mode"] = True
-            st.session_state["search_text"] = search_text
-            st.session_state["last_search"] = search_text
-            st.rerun()
-        elif search_clicked:  # Только если нажата кнопка (не Enter)
-            st.warning("Введите текст для поиска")
-    
-    st.write("---")
-    
-    # Панель админа
-    if not st.session_state.admin_logged_in:
-        with st.form("admin_login"):
-            password = st.text_input("Пароль админа", type="password")
-            if st.form_submit_button("Войти как админ"):
-                if hash_password(password) == ADMIN_PASSWORD_HASH:
-                    st.session_state.admin_logged_in = True
-                    st.rerun()
-                else:
-                    st.error("Неверный пароль")
-    else:
-        st.success("✅ Админ")
-        if st.button("Выйти", use_container_width=True):
-            st.session_state.admin_logged_in = False
-            st.rerun()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Перезапусков", metrics.reruns.count)
+        with col2:
+            st.metric("Перезапуск p50", f"{metrics.reruns.percentile(50)} мс")
+        with col3:
+            st.metric("Перезапуск p95", f"{metrics.reruns.percentile(95)} мс")
+        with col4:
+            st.metric("Попадания в кэш", f"{metrics.cache_hit_ratio():.0%}")
     
-    st.write("---")
-    st.subheader("📂 Разделы")
+        st.markdown("**Куда уходит время перезапуска, мс**")
+        st.bar_chart({"мс": {"SQL": metrics.phase_ms["sql"],
+                             "Сборка результата": metrics.phase_ms["build"],
+                             "Отрисовка": metrics.phase_ms["render"]}})
     
-    # Кнопка "Главная"
-    if st.button("🏠 Главная", use_container_width=True, key="main_button"):
-        # Очищаем все состояния связанные с поиском и разделами
-        for key in ["search_mode", "search_text", "current_section", "section_title"]:
-            if key in st.session_state:
-                del st.session_state[key]
-        st.rerun()
+        st.markdown("**Гистограмма времени перезапуска**")
+        st.bar_chart({"Перезапусков": metrics.histogram()})
     
-    # Получаем список разделов
-    sections_df = get_sections()
+        st.markdown("**Запросы**")
+        query_rows = metrics.query_rows()
+        st.dataframe(query_rows, use_container_width=True, hide_index=True)
+        if query_rows:
+            selected_query = st.selectbox("Гистограмма для запроса", [row["Запрос"] for row in query_rows])
+            st.bar_chart({"Вызовов": metrics.histogram(selected_query)})
     
-    if not sections_df.empty:
-        st.write("---")
-        
-        # Показываем разделы как кликабельные кнопки
-        for _, section in sections_df.iterrows():
-            if st.button(f"📁 {section['title']}", 
-                        use_container_width=True,
-                        key=f"nav_{section['id']}"):
-                # Выходим из режима поиска
-                if "search_mode" in st.session_state:
-                    del st.session_state["search_mode"]
-                if "search_text" in st.session_state:
-                    del st.session_state["search_text"]
-                st.session_state["current_section"] = section['id']
-                st.session_state["section_title"] = section['title']
+        st.markdown("**Функции доступа к данным**")
+        st.dataframe(metrics.helper_rows(), use_container_width=True, hide_index=True)
+    
+        st.markdown("**Самые медленные запросы**")
+        st.dataframe(metrics.slowest_rows(), use_container_width=True, hide_index=True)
+    
+        col_download, col_file, col_reset = st.columns(3)
+        with col_download:
+            st.download_button("⬇️ Prometheus", data=metrics.to_prometheus(), file_name="metrics.prom",
+                               mime="text/plain", use_container_width=True)
+        with col_file:
+            if METRICS_FILE and st.button(f"💾 Записать в {METRICS_FILE}", use_container_width=True):
+                metrics.write_prometheus(METRICS_FILE)
+                st.success("Метрики записаны")
+        with col_reset:
+            if st.button("🔄 Сбросить", use_container_width=True):
+                metrics.reset()
                 st.rerun()
-    else:
-        st.info("Нет разделов")
 
-# ===== ГЛАВНАЯ ОБЛАСТЬ =====
-# Режим поиска
-if st.session_state.get("search_mode"):
-    search_text = st.session_state.get("search_text", "")
-    
-    if st.button("← Назад"):
-        del st.session_state["search_mode"]
-        if "search_text" in st.session_state:
-            del st.session_state["search_text"]
-        st.rerun()
+    # Режим поиска
+    elif st.session_state.get("search_mode"):
+        search_text = st.session_state.get("search_text", "")
     
-    st.subheader(f"🔍 Результаты поиска: '{search_text}'")
+        if st.button("← Назад"):
+            del st.session_state["search_mode"]
+            if "search_text" in st.session_state:
+                del st.session_state["search_text"]
+            st.rerun()
     
-    results = search_questions(search_text)
+        st.subheader(f"🔍 Результаты поиска: '{search_text}'")
     
-    if not results.empty:
-        for _, question in results.iterrows():
-            with st.expander(f"📁 {question['section_title']} » {question['question'][:50]}..."):
-                col1, col2, col3 = st.columns(3)
+        # Точный поиск по словам или поиск похожих по смыслу вопросов
+        search_kind = st.radio(
+            "Режим поиска",
+            ["По словам", "Похожие вопросы"],
+            horizontal=True,
+            key="search_kind",
+            label_visibility="collapsed"
+        )
+    
+        search_page = None
+        if search_kind == "Похожие вопросы":
+            similar = similar_questions(search_text)
+            results = get_questions_by_ids(tuple(question_id for question_id, _ in similar))
+        else:
+            # Возможная опечатка в запросе
+            corrected = correct_query(search_text)
+            if corrected:
+                if st.button(f"Возможно, вы имели в виду: «{corrected}»", key="search_corrected"):
+                    start_search(corrected)
+        
+            # Сужение по разделу: число совпадений приходит вместе со страницей
+            # (0 — все разделы)
+            search_offset = st.session_state.get("search_offset", 0)
+            search_page = search_questions(search_text, st.session_state.get("search_section") or None,
+                                           search_offset, SEARCH_PAGE_SIZE)
+            # Страница могла опустеть после удаления вопросов — возвращаемся к началу
+            if not search_page.results and search_offset:
+                st.session_state.pop("search_offset", None)
+                st.rerun()
+            if search_page.total:
+                facet_titles = {facet.id: f"{facet.title} ({facet.question_count})" for facet in search_page.facets}
+                st.selectbox(
+                    "Раздел",
+                    [0] + list(facet_titles),
+                    format_func=lambda section_id: facet_titles.get(section_id, f"Все разделы ({search_page.total})"),
+                    key="search_section",
+                    on_change=lambda: st.session_state.pop("search_offset", None),
+                )
+            results = search_page.results
+    
+        # В журнал поиска — один раз на запрос и режим, а не на каждый перезапуск
+        if st.session_state.get("logged_search") != (search_text, search_kind):
+            st.session_state["logged_search"] = (search_text, search_kind)
+            if search_page is None:
+                record_search(search_text, "similar", len(results))
+            else:
+                record_search(search_text, "words", search_page.total)
+    
+        if results:
+            for item in results:
+                question = open_question(item.id, f"📁 {item.section_title} » {item.title[:50]}...", "open_search",
+                                         on_open=lambda: record_click(search_text, item.id))
+                if question is None:
+                    continue
+                with st.container(border=True):
+                    # Фрагмент с подсветкой найденных слов
+                    if item.snippet:
+                        st.markdown(item.snippet)
                 
-                with col1:
-                    st.markdown("**Вопрос / Ситуация**")
-                    st.write(question['question'])
+                    col1, col2, col3 = st.columns(3)
                 
-                with col2:
-                    st.markdown("**Ответ / Действия**")
-                    st.write(question['answer'] if question['answer'] else "—")
+                    with col1:
+                        st.markdown("**Вопрос / Ситуация**")
+                        st.write(question.question)
                 
-                with col3:
-                    st.markdown("**Дополнительно**")
-                    st.write(question['info'] if question['info'] else "—")
-    else:
-        st.info("Ничего не найдено")
+                    with col2:
+                        st.markdown("**Ответ / Действия**")
+                        st.write(question.answer if question.answer else "—")
+                
+                    with col3:
+                        st.markdown("**Дополнительно**")
+                        st.write(question.info if question.info else "—")
+        
+            # Переключение страниц поиска
+            if search_page is not None:
+                col_prev, col_info, col_next = st.columns([1, 2, 1])
+                with col_prev:
+                    if st.button("← Предыдущие", disabled=search_offset == 0,
+                                 use_container_width=True, key="search_prev"):
+                        st.session_state["search_offset"] = max(0, search_offset - SEARCH_PAGE_SIZE)
+                        st.rerun()
+                with col_info:
+                    st.caption(f"Результаты {search_offset + 1}–{search_offset + len(results)} из {search_page.found}")
+                with col_next:
+                    if st.button("Следующие →", disabled=search_offset + len(results) >= search_page.found,
+                                 use_container_width=True, key="search_next"):
+                        st.session_state["search_offset"] = search_offset + SEARCH_PAGE_SIZE
+                        st.rerun()
+        else:
+            st.info("Ничего не найдено")
 
-# Режим просмотра раздела
-elif "current_section" in st.session_state:
-    section_id = st.session_state["current_section"]
-    section_title = st.session_state.get("section_title", "")
-    
-    # Получаем информацию о разделе
-    with get_db_connection() as conn:
-        section_info = pd.read_sql(f"SELECT * FROM sections WHERE id = {section_id}", conn)
-    
-    if not section_info.empty:
-        current_section = section_info.iloc[0]
-        current_desc = current_section['description']
+    # Режим просмотра раздела
+    elif "current_section" in st.session_state:
+        section_id = st.session_state["current_section"]
+        section_title = st.session_state.get("section_title", "")
+    
+        # Получаем информацию о разделе
+        current_section = get_section(section_id)
+    
+        if current_section:
+            current_desc = current_section.description
         
-        # Кнопка назад
-        if st.button("← Назад к разделам"):
-            del st.session_state["current_section"]
-            if "section_title" in st.session_state:
-                del st.session_state["section_title"]
-            st.rerun()
+            # Кнопка назад
+            if st.button("← Назад к разделам"):
+                del st.session_state["current_section"]
+                if "section_title" in st.session_state:
+                    del st.session_state["section_title"]
+                st.rerun()
         
-        # Заголовок раздела
-        col_title, col_stats, col_admin = st.columns([3, 1, 1])
-        with col_title:
-            st.subheader(section_title)
-            if current_desc:
-                st.caption(current_desc)
-        with col_stats:
-            questions_df = get_questions(section_id)
-            st.metric("Вопросов", len(questions_df))
+            # Заголовок раздела
+            col_title, col_stats, col_admin = st.columns([3, 1, 1])
+            with col_title:
+                st.subheader(section_title)
+                if current_desc:
+                    st.caption(current_desc)
+            with col_stats:
+                questions_total = count_questions(section_id)
+                st.metric("Вопросов", questions_total)
         
-        # Кнопки редактирования раздела для админа
-        if st.session_state.admin_logged_in:
-            with col_admin:
-                if st.button("✏️ Редакт. раздел", use_container_width=True):
-                    st.session_state["editing_section"] = section_id
+            # Кнопки редактирования раздела для админа
+            if st.session_state.admin_logged_in:
+                with col_admin:
+                    if st.button("✏️ Редакт. раздел", use_container_width=True):
+                        st.session_state["editing_section"] = section_id
         
-        # Форма редактирования раздела
-        if st.session_state.admin_logged_in and "editing_section" in st.session_state and st.session_state.editing_section == section_id:
-            with st.form(f"edit_section_{section_id}"):
-                new_title = st.text_input("Название раздела", value=section_title)
-                new_desc = st.text_area("Описание раздела", value=current_desc if current_desc else "")
+            # Форма редактирования раздела
+            if st.session_state.admin_logged_in and "editing_section" in st.session_state and st.session_state.editing_section == section_id:
+                with st.form(f"edit_section_{section_id}"):
+                    new_title = st.text_input("Название раздела", value=section_title)
+                    new_desc = st.text_area("Описание раздела", value=current_desc if current_desc else "")
                 
-                col_save, col_cancel, col_delete = st.columns(3)
-                with col_save:
-                    if st.form_submit_button("💾 Сохранить", use_container_width=True):
-                        update_section(section_id, new_title, new_desc)
-                        st.session_state["section_title"] = new_title
-                        del st.session_state["editing_section"]
-                        st.success("Раздел обновлен!")
-                        st.rerun()
-                with col_cancel:
-                    if st.form_submit_button("❌ Отмена", use_container_width=True):
-                        del st.session_state["editing_section"]
-                        st.rerun()
-                with col_delete:
-                    if st.form_submit_button("🗑️ Удалить", use_container_width=True):
-                        delete_section(section_id)
-                        del st.session_state["editing_section"]
-                        del st.session_state["current_section"]
-                        st.success("Раздел удален!")
-                        st.rerun()
+                    col_save, col_cancel, col_delete = st.columns(3)
+                    with col_save:
+                        if st.form_submit_button("💾 Сохранить", use_container_width=True):
+                            if wait_for_write(update_section(section_id, new_title, new_desc)):
+                                st.session_state["section_title"] = new_title
+                                del st.session_state["editing_section"]
+                                st.success("Раздел обновлен!")
+                                st.rerun()
+                    with col_cancel:
+                        if st.form_submit_button("❌ Отмена", use_container_width=True):
+                            del st.session_state["editing_section"]
+                            st.rerun()
+                    with col_delete:
+                        if st.form_submit_button("🗑️ Удалить", use_container_width=True):
+                            if wait_for_write(delete_section(section_id)):
+                                del st.session_state["editing_section"]
+                                del st.session_state["current_section"]
+                                st.success("Раздел удален!")
+                                st.rerun()
         
-        # Форма добавления вопроса (только для админа)
-        if st.session_state.admin_logged_in:
-            with st.expander("➕ Добавить новый вопрос", expanded=False):
-                with st.form(f"add_q_{section_id}", clear_on_submit=True):
-                    question_text = st.text_area("Вопрос / Ситуация", height=100)
-                    answer_text = st.text_area("Ответ / Порядок действий", height=150)
-                    info_text = st.text_area("Дополнительно / Важно", height=100)
+            # Форма добавления вопроса (только для админа)
+            if st.session_state.admin_logged_in:
+                with st.expander("➕ Добавить новый вопрос", expanded=False):
+                    with st.form(f"add_q_{section_id}", clear_on_submit=True):
+                        question_text = st.text_area("Вопрос / Ситуация", height=100)
+                        answer_text = st.text_area("Ответ / Порядок действий", height=150)
+                        info_text = st.text_area("Дополнительно / Важно", height=100)
                     
-                    if st.form_submit_button("Добавить"):
-                        if question_text:
-                            add_question(section_id, question_text, answer_text, info_text)
-                            st.success("Вопрос добавлен!")
-                            st.rerun()
+                        if st.form_submit_button("Добавить"):
+                            if question_text:
+                                fields = (section_id, question_text, answer_text, info_text)
+                                duplicates = find_duplicates(question_text)
+                                if duplicates:
+                                    st.session_state[f"pending_add_{section_id}"] = (fields, duplicates)
+                                    st.rerun()
+                                elif wait_for_write(add_question(*fields)):
+                                    st.success("Вопрос добавлен!")
+                                    st.rerun()
+            
+                if f"pending_add_{section_id}" in st.session_state:
+                    if duplicate_warning(f"pending_add_{section_id}", add_question):
+                        st.success("Вопрос добавлен!")
+                        st.rerun()
         
-        # Показываем вопросы
-        questions_df = get_questions(section_id)
+            # Постраничная навигация: храним id, после которых начинаются
+            # просмотренные страницы, и сбрасываем их при смене раздела
+            if st.session_state.get("pages_section") != section_id:
+                st.session_state["pages_section"] = section_id
+                st.session_state["page_starts"] = [0]
+            page_starts = st.session_state["page_starts"]
+            page_size = st.session_state.get("page_size", QUESTIONS_PAGE_SIZE)
         
-        if not questions_df.empty:
-            for idx, question in questions_df.iterrows():
-                with st.expander(f"❓ {question['question'][:80]}...", expanded=False):
-                    col1, col2, col3 = st.columns(3)
+            # Показываем только текущую страницу (берём на одну запись больше,
+            # чтобы понять, есть ли следующая)
+            questions_page = get_questions_page(section_id, page_starts[-1], page_size + 1)
+            has_next = len(questions_page) > page_size
+            questions_page = questions_page[:page_size]
+        
+            # Страница опустела (например, после удаления) — возвращаемся назад
+            if not questions_page and len(page_starts) > 1:
+                page_starts.pop()
+                st.rerun()
+        
+            if questions_page:
+                for item in questions_page:
+                    question = open_question(item.id, f"❓ {item.title[:80]}...", "open_section")
+                    if question is None:
+                        continue
+                    with st.container(border=True):
+                        col1, col2, col3 = st.columns(3)
                     
-                    with col1:
-                        st.markdown("**Вопрос / Ситуация**")
-                        st.info(question['question'])
+                        with col1:
+                            st.markdown("**Вопрос / Ситуация**")
+                            st.info(question.question)
                     
-                    with col2:
-                        st.markdown("**Ответ / Действия**")
-                        if question['answer']:
-                            st.success(question['answer'])
-                        else:
-                            st.write("—")
+                        with col2:
+                            st.markdown("**Ответ / Действия**")
+                            if question.answer:
+                                st.success(question.answer)
+                            else:
+                                st.write("—")
                     
-                    with col3:
-                        st.markdown("**Дополнительно**")
-                        if question['info']:
-                            st.warning(question['info'])
-                        else:
-                            st.write("—")
+                        with col3:
+                            st.markdown("**Дополнительно**")
+                            if question.info:
+                                st.warning(question.info)
+                            else:
+                                st.write("—")
                     
-                    # Кнопки управления для админа
-                    if st.session_state.admin_logged_in:
-                        col_btn1, col_btn2 = st.columns(2)
-                        with col_btn1:
-                            if st.button(f"✏️ Редактировать", key=f"edit_{question['id']}", use_container_width=True):
-                                st.session_state[f"editing_{question['id']}"] = True
-                        with col_btn2:
-                            if st.button(f"🗑️ Удалить", key=f"del_{question['id']}", use_container_width=True):
-                                delete_question(question['id'])
-                                st.success("Вопрос удален!")
-                                st.rerun()
+                        # Кнопки управления для админа
+                        if st.session_state.admin_logged_in:
+                            col_btn1, col_btn2 = st.columns(2)
+                            with col_btn1:
+                                if st.button(f"✏️ Редактировать", key=f"edit_{question.id}", use_container_width=True):
+                                    st.session_state[f"editing_{question.id}"] = True
+                            with col_btn2:
+                                if st.button(f"🗑️ Удалить", key=f"del_{question.id}", use_container_width=True):
+                                    if wait_for_write(delete_question(question.id)):
+                                        st.success("Вопрос удален!")
+                                        st.rerun()
                         
-                        # Форма редактирования вопроса
-                        if f"editing_{question['id']}" in st.session_state:
-                            with st.form(f"edit_form_{question['id']}"):
-                                edit_q = st.text_area("Вопрос", value=question['question'], height=100)
-                                edit_a = st.text_area("Ответ", value=question['answer'], height=150)
-                                edit_i = st.text_area("Дополнительно", value=question['info'] if question['info'] else "", height=100)
+                            # Форма редактирования вопроса
+                            if f"editing_{question.id}" in st.session_state:
+                                with st.form(f"edit_form_{question.id}"):
+                                    edit_q = st.text_area("Вопрос", value=question.question, height=100)
+                                    edit_a = st.text_area("Ответ", value=question.answer, height=150)
+                                    edit_i = st.text_area("Дополнительно", value=question.info if question.info else "", height=100)
                                 
-                                col_save, col_cancel = st.columns(2)
-                                with col_save:
-                                    if st.form_submit_button("💾 Сохранить", use_container_width=True):
-                                        update_question(question['id'], edit_q, edit_a, edit_i)
-                                        del st.session_state[f"editing_{question['id']}"]
+                                    col_save, col_cancel = st.columns(2)
+                                    with col_save:
+                                        if st.form_submit_button("💾 Сохранить", use_container_width=True):
+                                            fields = (question.id, edit_q, edit_a, edit_i)
+                                            # Проверяем только изменившийся текст вопроса
+                                            duplicates = (find_duplicates(edit_q, exclude_id=question.id)
+                                                          if edit_q != question.question else [])
+                                            if duplicates:
+                                                st.session_state[f"pending_edit_{question.id}"] = (fields, duplicates)
+                                                st.rerun()
+                                            elif wait_for_write(update_question(*fields)):
+                                                del st.session_state[f"editing_{question.id}"]
+                                                st.success("Изменения сохранены!")
+                                                st.rerun()
+                                    with col_cancel:
+                                        if st.form_submit_button("❌ Отмена", use_container_width=True):
+                                            del st.session_state[f"editing_{question.id}"]
+                                            st.rerun()
+                            
+                                if f"pending_edit_{question.id}" in st.session_state:
+                                    if duplicate_warning(f"pending_edit_{question.id}", update_question):
+                                        del st.session_state[f"editing_{question.id}"]
                                         st.success("Изменения сохранены!")
                                         st.rerun()
-                                with col_cancel:
-                                    if st.form_submit_button("❌ Отмена", use_container_width=True):
-                                        del st.session_state[f"editing_{question['id']}"]
-                                        st.rerun()
-        else:
-            st.info("В этом разделе пока нет вопросов.")
+            
+                # Переключение страниц
+                first_number = (len(page_starts) - 1) * page_size + 1
+                col_prev, col_info, col_next, col_size = st.columns([1, 2, 1, 1])
+                with col_prev:
+                    if st.button("← Предыдущие", disabled=len(page_starts) == 1,
+                                 use_container_width=True, key="page_prev"):
+                        page_starts.pop()
+                        st.rerun()
+                with col_info:
+                    st.caption(f"Вопросы {first_number}–{first_number + len(questions_page) - 1} из {questions_total}")
+                with col_next:
+                    if st.button("Следующие →", disabled=not has_next,
+                                 use_container_width=True, key="page_next"):
+                        page_starts.append(questions_page[-1].id)
+                        st.rerun()
+                with col_size:
+                    st.selectbox(
+                        "На странице",
+                        PAGE_SIZE_OPTIONS,
+                        index=PAGE_SIZE_OPTIONS.index(page_size),
+                        key="page_size",
+                        on_change=lambda: st.session_state.update(page_starts=[0]),
+                        label_visibility="collapsed"
+                    )
+            else:
+                st.info("В этом разделе пока нет вопросов.")
 
-# ===== ГЛАВНАЯ СТРАНИЦА =====
-else:
-    st.title("📚 База знаний для сотрудников")
+    # ===== ГЛАВНАЯ СТРАНИЦА =====
+    else:
+        st.title("📚 База знаний для сотрудников")
     
-    # Свертываемые инструкции
-    with st.expander("📖 Инструкция по использованию", expanded=False):
-        col_user, col_admin = st.columns(2)
+        # Свертываемые инструкции
+        with st.expander("📖 Инструкция по использованию", expanded=False):
+            col_user, col_admin = st.columns(2)
         
-        with col_user:
-            st.subheader("👤 Для пользователей")
-            st.markdown("""
-            **🔍 Поиск информации:**
-            1. Введите ключевые слова в поле поиска (боковая панель)
-            2. Нажмите Enter или кнопку "Найти"
+            with col_user:
+                st.subheader("👤 Для пользователей")
+                st.markdown("""
+                **🔍 Поиск информации:**
+                1. Введите ключевые слова в поле поиска (боковая панель)
+                2. Нажмите Enter или кнопку "Найти"
             
-            **📂 Просмотр по разделам:**
-            1. Выберите раздел в боковой панели
-            2. Кликните на вопрос для просмотра
-            3. Используйте кнопки "Назад" для возврата
+                **📂 Просмотр по разделам:**
+                1. Выберите раздел в боковой панели
+                2. Кликните на вопрос для просмотра
+                3. Используйте кнопки "Назад" для возврата
             
-            **🎯 Быстрый доступ:**
-            - **🏠 Главная** - возврат на эту страницу
-            - **📥 Недавние** - новые разделы и вопросы ниже
-            """)
+                **🎯 Быстрый доступ:**
+                - **🏠 Главная** - возврат на эту страницу
+                - **📥 Недавние** - новые разделы и вопросы ниже
+                """)
         
-        if st.session_state.admin_logged_in:
-            with col_admin:
-                st.subheader("🔧 Для администратора")
-                st.markdown("""
-                **📁 Управление разделами:**
-                - **Создать:** Форма "Создать новый раздел" ниже
-                - **Редактировать:** Кнопка ✏️ в заголовке раздела
-                - **Удалить:** Кнопка 🗑️ в форме редактирования
+            if st.session_state.admin_logged_in:
+                with col_admin:
+                    st.subheader("🔧 Для администратора")
+                    st.markdown("""
+                    **📁 Управление разделами:**
+                    - **Создать:** Форма "Создать новый раздел" ниже
+                    - **Редактировать:** Кнопка ✏️ в заголовке раздела
+                    - **Удалить:** Кнопка 🗑️ в форме редактирования
                 
-                **❓ Управление вопросами:**
-                - **Добавить:** Кнопка ➕ в разделе
-                - **Редактировать:** Кнопка ✏️ под вопросом
-                - **Удалить:** Кнопка 🗑️ под вопросом
+                    **❓ Управление вопросами:**
+                    - **Добавить:** Кнопка ➕ в разделе
+                    - **Редактировать:** Кнопка ✏️ под вопросом
+                    - **Удалить:** Кнопка 🗑️ под вопросом
                 
-                **⚠️ Важно:**
-                - Все изменения сохраняются сразу
-                - Удаленные данные не восстанавливаются
-                - Не забывайте выходить из аккаунта 🔐
-                """)
-        else:
-            with col_admin:
-                st.subheader("🔐 Для администраторов")
-                st.info("""
-                Войдите в систему для управления базой знаний:
-                1. Введите пароль в боковой панели
-                2. Нажмите "Войти как админ"
-                3. Получите доступ к редактированию
-                """)
+                    **⚠️ Важно:**
+                    - Все изменения сохраняются сразу
+                    - Удаленные данные можно вернуть только из резервной копии (💾 Резервные копии)
+                    - Не забывайте выходить из аккаунта 🔐
+                    """)
+            else:
+                with col_admin:
+                    st.subheader("🔐 Для администраторов")
+                    st.info("""
+                    Войдите в систему для управления базой знаний:
+                    1. Введите пароль в боковой панели
+                    2. Нажмите "Войти как админ"
+                    3. Получите доступ к редактированию
+                    """)
     
-    # Быстрая статистика
-    sections_count, questions_count = get_total_stats()
+        # Быстрая статистика и последние записи — одним запросом к сводке
+        summary = get_home_summary(sections_limit=3, questions_limit=5)
     
-    col1, col2 = st.columns(2)
-    with col1:
-        st.metric("📁 Всего разделов", sections_count)
-    with col2:
-        st.metric("❓ Всего вопросов", questions_count)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("📁 Всего разделов", summary.sections)
+        with col2:
+            st.metric("❓ Всего вопросов", summary.questions)
+        if summary.updated_at:
+            st.caption(f"🕒 Последнее изменение: {format_datetime(summary.updated_at)}")
     
-    st.write("---")
+        st.write("---")
     
-    # ВОССТАНАВЛИВАЕМ ПАНЕЛЬ УПРАВЛЕНИЯ РАЗДЕЛАМИ ДЛЯ АДМИНА
-    if st.session_state.admin_logged_in:
-        st.subheader("🛠️ Управление разделами (админ)")
+        # ВОССТАНАВЛИВАЕМ ПАНЕЛЬ УПРАВЛЕНИЯ РАЗДЕЛАМИ ДЛЯ АДМИНА
+        if st.session_state.admin_logged_in:
+            st.subheader("🛠️ Управление разделами (админ)")
         
-        # Создание нового раздела
-        with st.form("new_section_form", clear_on_submit=True):
-            st.write("**Создать новый раздел:**")
-            col1, col2 = st.columns([2, 1])
-            with col1:
-                title = st.text_input("Название")
-            with col2:
-                description = st.text_input("Описание")
+            # Создание нового раздела
+            with st.form("new_section_form", clear_on_submit=True):
+                st.write("**Создать новый раздел:**")
+                col1, col2 = st.columns([2, 1])
+                with col1:
+                    title = st.text_input("Название")
+                with col2:
+                    description = st.text_input("Описание")
             
-            if st.form_submit_button("➕ Создать раздел"):
-                if title:
-                    add_section(title, description)
-                    st.success(f"Раздел '{title}' создан!")
-                    st.rerun()
+                if st.form_submit_button("➕ Создать раздел"):
+                    if title:
+                        if wait_for_write(add_section(title, description)):
+                            st.success(f"Раздел '{title}' создан!")
+                            st.rerun()
         
-        # Список всех разделов для управления
-        sections_df = get_sections()
-        if not sections_df.empty:
-            st.write("---")
-            st.write("**Все разделы:**")
+            # Список всех разделов для управления
+            sections = get_sections_with_counts()
+            if sections:
+                st.write("---")
+                st.write("**Все разделы:**")
             
-            for _, section in sections_df.iterrows():
-                col_sec, col_edit, col_del = st.columns([4, 1, 1])
-                with col_sec:
-                    st.write(f"**{section['title']}**")
-                    if section['description']:
-                        st.caption(section['description'])
-                    q_count = len(get_questions(section['id']))
-                    st.caption(f"Вопросов: {q_count}")
-                with col_edit:
-                    if st.button("✏️", key=f"edit_main_{section['id']}"):
-                        st.session_state["current_section"] = section['id']
-                        st.session_state["section_title"] = section['title']
-                        st.session_state["editing_section"] = section['id']
-                        st.rerun()
-                with col_del:
-                    if st.button("🗑️", key=f"del_main_{section['id']}"):
-                        delete_section(section['id'])
-                        st.success(f"Раздел '{section['title']}' удален!")
-                        st.rerun()
+                for section in sections:
+                    col_sec, col_edit, col_del = st.columns([4, 1, 1])
+                    with col_sec:
+                        st.write(f"**{section.title}**")
+                        if section.description:
+                            st.caption(section.description)
+                        st.caption(f"Вопросов: {section.question_count}")
+                    with col_edit:
+                        if st.button("✏️", key=f"edit_main_{section.id}"):
+                            st.session_state["current_section"] = section.id
+                            st.session_state["section_title"] = section.title
+                            st.session_state["editing_section"] = section.id
+                            st.rerun()
+                    with col_del:
+                        if st.button("🗑️", key=f"del_main_{section.id}"):
+                            if wait_for_write(delete_section(section.id)):
+                                st.success(f"Раздел '{section.title}' удален!")
+                                st.rerun()
         
-        st.write("---")
+            # Массовый импорт и экспорт
+            st.write("---")
+            with st.expander("📦 Импорт и экспорт", expanded=False):
+                col_import, col_export = st.columns(2)
+            
+                with col_import:
+                    st.write("**Импорт из файла**")
+                    st.caption("XLSX, CSV или JSONL с колонками: section (раздел), question (вопрос), "
+                               "answer (ответ), info (дополнительно). Недостающие разделы будут созданы.")
+                    upload = st.file_uploader("Файл для импорта", type=list(transfer.FORMATS),
+                                              key="import_file", label_visibility="collapsed")
+                    if upload is not None and st.button("📥 Импортировать", key="import_button",
+                                                        use_container_width=True):
+                        progress_bar = st.progress(0.0, text="Импорт...")
+                    
+                        def report_progress(imported):
+                            done = min(upload.tell() / max(upload.size, 1), 1.0)
+                            progress_bar.progress(done, text=f"Импортировано вопросов: {imported}")
+                    
+                        try:
+                            imported, skipped, created = transfer.import_file(upload, upload.name, report_progress)
+                        except Exception as e:
+                            st.error(f"Ошибка импорта: {e}")
+                        else:
+                            progress_bar.progress(1.0, text="Готово")
+                            st.success(f"Импортировано вопросов: {imported}, создано разделов: {created}")
+                            if skipped:
+                                st.warning(f"Пропущено строк без раздела: {skipped}")
+            
+                with col_export:
+                    st.write("**Экспорт базы**")
+                    export_format = st.selectbox("Формат", transfer.FORMATS, key="export_format")
+                    if st.button("📤 Подготовить файл", key="export_button", use_container_width=True):
+                        with st.spinner("Выгружаем..."):
+                            st.session_state["export_file"] = (export_format, transfer.export_bytes(export_format))
+                    if "export_file" in st.session_state:
+                        file_format, data = st.session_state["export_file"]
+                        st.download_button(
+                            f"⬇️ Скачать knowledge.{file_format}",
+                            data=data,
+                            file_name=f"knowledge.{file_format}",
+                            mime=transfer.MIME_TYPES[file_format],
+                            use_container_width=True
+                        )
+
+                if static_site.SITE_DIR and st.button(f"🌐 Обновить статический сайт в {static_site.SITE_DIR}",
+                                                      key="site_button", use_container_width=True):
+                    with st.spinner("Собираем сайт..."):
+                        rendered, total, removed = static_site.build_site(static_site.SITE_DIR)
+                    st.success(f"Сайт обновлён: перерисовано разделов {rendered} из {total}, удалено {removed}")
+
+            # Отчёт о почти одинаковых вопросах по всей базе
+            with st.expander("🧬 Дубликаты вопросов", expanded=False):
+                st.caption("Группы почти одинаковых вопросов во всех разделах.")
+                if st.button("🔎 Найти дубликаты", key="duplicates_button", use_container_width=True):
+                    with st.spinner("Ищем дубликаты..."):
+                        st.session_state["duplicate_clusters"] = duplicate_clusters()
+                clusters = st.session_state.get("duplicate_clusters")
+                if clusters is not None:
+                    if not clusters:
+                        st.success("Дубликатов не найдено")
+                    else:
+                        st.write(f"Групп: {len(clusters)}, вопросов в них: {sum(len(ids) for ids in clusters)}")
+                    for number, ids in enumerate(clusters[:DUPLICATE_CLUSTERS_SHOWN], 1):
+                        st.markdown(f"**Группа {number}** — вопросов: {len(ids)}")
+                        for item in get_questions_by_ids(tuple(ids)):
+                            if st.button(f"📁 {item.section_title} » {item.title[:80]}",
+                                         key=f"duplicate_{number}_{item.id}", use_container_width=True):
+                                start_search(item.title.strip(), open_question_id=item.id)
+                    if len(clusters) > DUPLICATE_CLUSTERS_SHOWN:
+                        st.caption(f"И ещё групп: {len(clusters) - DUPLICATE_CLUSTERS_SHOWN}")
+
+            # Что ищут сотрудники: сводка журнала поиска
+            with st.expander("📊 Аналитика поиска", expanded=False):
+                st.caption("Сводка обновляется в фоне раз в минуту; кнопка сводит накопившиеся поиски сразу.")
+                if st.button("📊 Построить отчёт", key="search_report_button", use_container_width=True):
+                    with st.spinner("Сводим журнал поиска..."):
+                        search_log = get_search_log()
+                        search_log.refresh()
+                        st.session_state["search_report"] = search_log.report()
+                report = st.session_state.get("search_report")
+                if report is not None:
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Поисков", report["searches"])
+                    with col2:
+                        st.metric("Без результатов", f"{report['empty'] / max(report['searches'], 1):.0%}")
+                    with col3:
+                        st.metric("Открыто вопросов из поиска", report["clicks"])
+                    st.caption(f"Сведено: {format_datetime(report['aggregated_at'])}")
+
+                    st.markdown("**Частые запросы**")
+                    st.dataframe(report["top_queries"], use_container_width=True, hide_index=True)
+                    st.markdown("**Запросы без результатов**")
+                    st.dataframe(report["empty_queries"], use_container_width=True, hide_index=True)
+                    st.markdown("**Чаще всего открывают из поиска**")
+                    st.dataframe(report["top_questions"], use_container_width=True, hide_index=True)
+
+            # Резервные копии: создание, сравнение с текущей базой и восстановление
+            with st.expander("💾 Резервные копии", expanded=False):
+                schedule = (f"каждые {backup.BACKUP_INTERVAL_HOURS:g} ч" if backup.BACKUP_INTERVAL_HOURS > 0
+                            else "только вручную")
+                st.caption(f"Каталог: {backup.BACKUP_DIR}. Копии снимаются {schedule}; хранятся последние "
+                           f"{backup.KEEP_LAST}, а также по одной за {backup.KEEP_DAILY} дней и {backup.KEEP_WEEKLY} недели.")
+                if st.button("📸 Создать копию сейчас", key="backup_create", use_container_width=True):
+                    try:
+                        with st.spinner("Создаём копию..."):
+                            created = backup.create_backup()
+                    except backup.BackupBusy as error:
+                        st.warning(str(error))
+                    else:
+                        st.success(f"Копия создана за {created.seconds:.1f} с: база {backup.format_size(created.db_size)} "
+                                   f"→ {backup.format_size(created.size)}")
+
+                backups = {item.name: item for item in backup.list_backups()}
+                if not backups:
+                    st.info("Копий пока нет")
+                else:
+                    selected_backup = st.selectbox(
+                        "Копия",
+                        list(backups),
+                        format_func=lambda name: (f"{format_datetime(backups[name].created_at)} — "
+                                                  f"{backup.format_size(backups[name].size)}"),
+                        key="backup_selected",
+                    )
+                    col_diff, col_restore = st.columns(2)
+                    with col_diff:
+                        if st.button("🔍 Сравнить с текущей базой", key="backup_diff", use_container_width=True):
+                            with st.spinner("Сравниваем..."):
+                                st.session_state["backup_diff_result"] = (selected_backup,
+                                                                          backup.diff_backup(selected_backup))
+                    with col_restore:
+                        confirm_restore = st.checkbox("Заменить текущие данные копией", key="backup_confirm")
+                        if st.button("♻️ Восстановить", key="backup_restore", disabled=not confirm_restore,
+                                     use_container_width=True):
+                            try:
+                                with st.spinner("Восстанавливаем..."):
+                                    before_restore = backup.restore_backup(selected_backup)
+                            except backup.BackupBusy as error:
+                                st.warning(str(error))
+                            else:
+                                st.session_state.pop("backup_diff_result", None)
+                                st.success(f"База восстановлена из копии от "
+                                           f"{format_datetime(backups[selected_backup].created_at)}. "
+                                           f"Прежнее состояние сохранено в копии {before_restore.name}")
+
+                    diff_result = st.session_state.get("backup_diff_result")
+                    if diff_result is not None and diff_result[0] in backups:
+                        diff_name, changes = diff_result
+                        st.markdown(f"**Изменения после копии от {format_datetime(backups[diff_name].created_at)}**")
+                        if changes.empty:
+                            st.success("Текущая база совпадает с копией")
+                        else:
+                            counts = changes.groupby(["Что", "Изменение"]).size()
+                            st.write(", ".join(f"{kind} {change}: {count}" for (kind, change), count in counts.items()))
+                            st.dataframe(changes, use_container_width=True, hide_index=True)
+
+            st.write("---")
     
-    # Последние добавленные разделы
-    recent_sections = get_recent_sections(limit=3)
-    if not recent_sections.empty:
-        st.subheader("📥 Недавно добавленные разделы")
+        # Последние добавленные разделы
+        recent_sections = summary.recent_sections
+        if recent_sections:
+            st.subheader("📥 Недавно добавленные разделы")
         
-        for _, section in recent_sections.iterrows():
-            with st.expander(f"📁 {section['title']}", expanded=False):
-                if section['description']:
-                    st.write(section['description'])
+            for section in recent_sections:
+                with st.expander(f"📁 {section.title}", expanded=False):
+                    if section.description:
+                        st.write(section.description)
                 
-                # Счетчик вопросов в разделе
-                q_df = get_questions(section['id'])
-                st.caption(f"📊 Вопросов в разделе: {len(q_df)}")
+                    # Счетчик вопросов в разделе
+                    st.caption(f"📊 Вопросов в разделе: {section.question_count}")
                 
-                # Дата создания
-                if 'created_at' in section and section['created_at']:
-                    st.caption(f"📅 Добавлен: {format_datetime(section['created_at'])}")
+                    # Дата создания
+                    if section.created_at:
+                        st.caption(f"📅 Добавлен: {format_datetime(section.created_at)}")
                 
-                # Кнопка перехода
-                if st.button("Перейти в раздел →", key=f"go_to_{section['id']}", use_container_width=True):
-                    st.session_state["current_section"] = section['id']
-                    st.session_state["section_title"] = section['title']
-                    st.rerun()
+                    # Кнопка перехода
+                    if st.button("Перейти в раздел →", key=f"go_to_{section.id}", use_container_width=True):
+                        st.session_state["current_section"] = section.id
+                        st.session_state["section_title"] = section.title
+                        st.rerun()
         
-        st.write("---")
+            st.write("---")
     
-    # Последние добавленные вопросы
-    recent_questions = get_recent_questions(limit=5)
-    if not recent_questions.empty:
-        st.subheader("🆕 Последние добавленные вопросы")
+        # Последние добавленные вопросы
+        recent_questions = summary.recent_questions
+        if recent_questions:
+            st.subheader("🆕 Последние добавленные вопросы")
         
-        for _, question in recent_questions.iterrows():
-            # Форматируем дату
-            date_str = ""
-            if 'created_at' in question and question['created_at']:
-                date_str = f" ({format_datetime(question['created_at'])})"
+            for item in recent_questions:
+                # Форматируем дату
+                date_str = ""
+                if item.created_at:
+                    date_str = f" ({format_datetime(item.created_at)})"
             
-            with st.expander(f"📁 {question['section_title']} » {question['question'][:60]}...{date_str}", expanded=False):
-                col_q, col_a = st.columns(2)
+                question = open_question(item.id, f"📁 {item.section_title} » {item.title[:60]}...{date_str}", "open_recent")
+                if question is None:
+                    continue
+                with st.container(border=True):
+                    col_q, col_a = st.columns(2)
                 
-                with col_q:
-                    st.markdown("**Вопрос / Ситуация**")
-                    st.info(question['question'])
+                    with col_q:
+                        st.markdown("**Вопрос / Ситуация**")
+                        st.info(question.question)
                 
-                with col_a:
-                    st.markdown("**Ответ / Действия**")
-                    if question['answer']:
-                        st.success(question['answer'][:200] + "..." if len(question['answer']) > 200 else question['answer'])
-                    else:
-                        st.write("—")
+                    with col_a:
+                        st.markdown("**Ответ / Действия**")
+                        if question.answer:
+                            st.success(question.answer[:200] + "..." if len(question.answer) > 200 else question.answer)
+                        else:
+                            st.write("—")
                 
-                # Дата создания вопроса
-                if 'created_at' in question and question['created_at']:
-                    st.caption(f"📅 Добавлен: {format_datetime(question['created_at'])}")
+                    # Дата создания вопроса
+                    if question.created_at:
+                        st.caption(f"📅 Добавлен: {format_datetime(question.created_at)}")
                 
-                # Кнопка перехода в раздел
-                if st.button(f"📂 Перейти в раздел '{question['section_title']}'", 
-                           key=f"nav_q_{question['id']}", 
-                           use_container_width=True):
-                    st.session_state["current_section"] = question['section_id']
-                    st.session_state["section_title"] = question['section_title']
-                    st.rerun()
+                    # Кнопка перехода в раздел
+                    if st.button(f"📂 Перейти в раздел '{question.section_title}'", 
+                               key=f"nav_q_{question.id}", 
+                               use_container_width=True):
+                        st.session_state["current_section"] = question.section_id
+                        st.session_state["section_title"] = question.section_title
+                        st.rerun()
         
-        st.write("---")
+            st.write("---")
     
-    # Инструкция для новых пользователей (если не админ)
-    if not st.session_state.admin_logged_in:
-        st.info("💡 **Совет:** Если вы администратор, войдите в систему для управления базой знаний.")
\ No newline at end of file
+        # Инструкция для новых пользователей (если не админ)
+        if not st.session_state.admin_logged_in:
+            st.info("💡 **Совет:** Если вы администратор, войдите в систему для управления базой знаний.")
+finally:
+    get_metrics().finish_rerun()
@@ -0,0 +1,365 @@
+# Резервные копии базы знаний без остановки приложения.
+#
+# Копия снимается через online backup API SQLite небольшими шагами с паузами,
+# чтобы не отнимать диск и процессор у запросов. Источник всё время копирования
+# держит одну транзакцию чтения: в режиме WAL она не мешает записи, а копия
+# получается согласованной — без неё каждая запись в другом соединении
+# начинала бы копирование заново. Копия проверяется (quick_check), сжимается
+# gzip и хранится по правилам ротации. Из копии можно восстановить базу
+# или сравнить её с текущей.
+#
+#   python backup.py              # снять копию и удалить лишние
+#   python backup.py --list
+#
+# Несколько процессов приложения на одной базе не снимают копии одновременно:
+# их разделяет файл-замок в каталоге копий.
+import argparse
+import atexit
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.request import pathname2url
+
+# Из командной строки: без сервера Streamlit кэши db предупреждают при импорте
+if __name__ == "__main__":
+    from benchmark import QUIET_LOGGERS
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).disabled = True
+
+import streamlit as st
+
+from db import CONNECTION_PRAGMAS, DB_FILE, read_sql, restore_database
+from models import Backup
+
+# Каталог копий (по умолчанию рядом с базой)
+BACKUP_DIR = os.environ.get("KNOWLEDGE_BACKUP_DIR") or os.path.splitext(DB_FILE)[0] + "-backups"
+
+# Как часто снимать копию в фоне, ч (0 — только вручную)
+BACKUP_INTERVAL_HOURS = float(os.environ.get("KNOWLEDGE_BACKUP_INTERVAL", "6"))
+
+# Как часто фоновый поток проверяет, не пора ли снять копию, с
+BACKUP_CHECK_INTERVAL = 60
+
+# Страниц за шаг копирования (1 МБ при странице 4 КБ)
+BACKUP_STEP_PAGES = 256
+
+# Какую долю времени копирование может работать: после каждого шага или куска
+# сжатия поток спит пропорционально тому, сколько работал. 0.25 — не больше
+# четверти одного ядра, копия снимается вчетверо дольше, чем без пауз
+BACKUP_MAX_LOAD = 0.25
+
+# Сжатие: размер куска и уровень gzip. Уровень 1 втрое быстрее уровня 6
+# при копии на треть больше — процессор нужнее запросам
+COMPRESS_CHUNK = 2 ** 20
+COMPRESS_LEVEL = 1
+
+# Ротация: последние копии, по одной за последние дни и за последние недели
+KEEP_LAST = 10
+KEEP_DAILY = 7
+KEEP_WEEKLY = 4
+
+# Замок старше этого считается брошенным (процесс упал во время копирования), с
+LOCK_STALE = 3600
+LOCK_FILE = ".backup.lock"
+
+BACKUP_PREFIX = os.path.basename(os.path.splitext(DB_FILE)[0])
+# В имени время до микросекунд: копия перед восстановлением может сниматься
+# в ту же секунду, что и восстанавливаемая (имена без них — от прежних версий)
+BACKUP_NAME_RE = re.compile(rf"^{re.escape(BACKUP_PREFIX)}-(\d{{8}}-\d{{6}})(?:-\d{{6}})?\.db\.gz$")
+
+class BackupBusy(Exception):
+    pass
+
+def _connect(path, uri=False):
+    conn = sqlite3.connect(path, timeout=5, uri=uri, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# Замок на каталог копий: файл, созданный с O_EXCL
+@contextmanager
+def _backup_lock():
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    path = os.path.join(BACKUP_DIR, LOCK_FILE)
+    try:
+        if time.time() - os.path.getmtime(path) > LOCK_STALE:
+            os.remove(path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        raise BackupBusy("Резервная копия уже создаётся или восстанавливается") from None
+    try:
+        yield
+    finally:
+        os.remove(path)
+
+def _pause(worked):
+    time.sleep(worked * (1 - BACKUP_MAX_LOAD) / BACKUP_MAX_LOAD)
+
+# ===== Список и ротация =====
+def list_backups():
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    backups = []
+    for name in os.listdir(BACKUP_DIR):
+        match = BACKUP_NAME_RE.match(name)
+        if match:
+            created_at = datetime.strptime(match.group(1), "%Y%m%d-%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+            backups.append(Backup(name=name, created_at=created_at,
+                                  size=os.path.getsize(os.path.join(BACKUP_DIR, name))))
+    return sorted(backups, key=lambda backup: (backup.created_at, backup.name), reverse=True)
+
+# Имена копий, которые остаются: KEEP_LAST последних и самая новая копия
+# каждого из KEEP_DAILY последних дней и KEEP_WEEKLY последних недель
+def backups_to_keep(backups):
+    keep = {backup.name for backup in backups[:KEEP_LAST]}
+    periods = (
+        (lambda created_at: created_at[:10], KEEP_DAILY),
+        (lambda created_at: datetime.strptime(created_at[:10], "%Y-%m-%d").isocalendar()[:2], KEEP_WEEKLY),
+    )
+    for period_of, count in periods:
+        seen = set()
+        for backup in backups:
+            period = period_of(backup.created_at)
+            if period not in seen:
+                if len(seen) == count:
+                    break
+                seen.add(period)
+                keep.add(backup.name)
+    return keep
+
+def rotate_backups():
+    backups = list_backups()
+    keep = backups_to_keep(backups)
+    removed = 0
+    for backup in backups:
+        if backup.name not in keep:
+            os.remove(os.path.join(BACKUP_DIR, backup.name))
+            removed += 1
+    return removed
+
+# ===== Создание =====
+# Копирование по шагам; возвращает (число шагов, самый долгий шаг, мс)
+def _copy_database(source, target):
+    steps, max_step_ms = 0, 0.0
+    step_started = time.perf_counter()
+
+    def progress(status, remaining, total):
+        nonlocal steps, max_step_ms, step_started
+        step_ms = (time.perf_counter() - step_started) * 1000
+        steps += 1
+        max_step_ms = max(max_step_ms, step_ms)
+        if remaining:
+            _pause(step_ms / 1000)
+        step_started = time.perf_counter()
+
+    source.backup(target, pages=BACKUP_STEP_PAGES, progress=progress)
+    return steps, max_step_ms
+
+def _compress(path, target_path):
+    with open(path, "rb") as source, gzip.open(target_path, "wb", compresslevel=COMPRESS_LEVEL) as target:
+        while True:
+            started = time.perf_counter()
+            chunk = source.read(COMPRESS_CHUNK)
+            if not chunk:
+                break
+            target.write(chunk)
+            _pause(time.perf_counter() - started)
+
+def _create_backup():
+    started = time.perf_counter()
+    created = datetime.now(timezone.utc)
+    name = f"{BACKUP_PREFIX}-{created:%Y%m%d-%H%M%S-%f}.db.gz"
+    path = os.path.join(BACKUP_DIR, name)
+    # Копии создаются под замком, поэтому проверки достаточно
+    if os.path.exists(path):
+        raise FileExistsError(f"Копия {name} уже существует")
+    temp_db = f"{path}.db.tmp"
+    temp_gz = f"{path}.tmp"
+    try:
+        source = _connect(DB_FILE)
+        target = sqlite3.connect(temp_db)
+        try:
+            source.execute("PRAGMA query_only = ON")
+            # Одна транзакция чтения на всё копирование — согласованный снимок
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            steps, max_step_ms = _copy_database(source, target)
+            source.rollback()
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise sqlite3.DatabaseError(f"Копия повреждена: {check}")
+        finally:
+            target.close()
+            source.close()
+        db_size = os.path.getsize(temp_db)
+        _compress(temp_db, temp_gz)
+        os.replace(temp_gz, path)
+    finally:
+        for temp_path in (temp_db, f"{temp_db}-wal", f"{temp_db}-shm", temp_gz):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return Backup(name=name, created_at=created.strftime("%Y-%m-%d %H:%M:%S"), size=os.path.getsize(path),
+                  db_size=db_size, seconds=time.perf_counter() - started, steps=steps, max_step_ms=max_step_ms)
+
+def create_backup():
+    with _backup_lock():
+        backup = _create_backup()
+        rotate_backups()
+    return backup
+
+# ===== Восстановление и сравнение =====
+def _backup_path(name):
+    if not BACKUP_NAME_RE.match(name):
+        raise ValueError(f"Неизвестная копия: {name}")
+    return os.path.join(BACKUP_DIR, name)
+
+# Копия, распакованная во временный файл (у каждого вызова свой)
+@contextmanager
+def _extracted(name):
+    source_path = _backup_path(name)
+    descriptor, path = tempfile.mkstemp(suffix=".restore.tmp", dir=BACKUP_DIR)
+    try:
+        with gzip.open(source_path, "rb") as source, os.fdopen(descriptor, "wb") as target:
+            shutil.copyfileobj(source, target, COMPRESS_CHUNK)
+        yield path
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+# Перед восстановлением снимается копия текущей базы, так что и его можно отменить.
+# Возвращает эту копию.
+def restore_backup(name):
+    with _backup_lock():
+        current = _create_backup()
+        with _extracted(name) as path:
+            source = sqlite3.connect(path)
+            try:
+                check = source.execute("PRAGMA quick_check").fetchone()[0]
+                if check != "ok":
+                    raise sqlite3.DatabaseError(f"Копия повреждена: {check}")
+                restore_database(source)
+            finally:
+                source.close()
+        rotate_backups()
+    return current
+
+# Чем текущая база отличается от копии: разделы и вопросы, которые
+# добавлены, изменены или удалены после неё
+DIFF_QUERY = """
+    SELECT 'удалён' AS "Изменение", 'раздел' AS "Что", b.id AS "№", b.title AS "Раздел", NULL AS "Вопрос"
+    FROM main.sections b
+    WHERE NOT EXISTS (SELECT 1 FROM live.sections l WHERE l.id = b.id)
+    UNION ALL
+    SELECT 'добавлен', 'раздел', l.id, l.title, NULL
+    FROM live.sections l
+    WHERE NOT EXISTS (SELECT 1 FROM main.sections b WHERE b.id = l.id)
+    UNION ALL
+    SELECT 'изменён', 'раздел', l.id, l.title, NULL
+    FROM live.sections l
+    JOIN main.sections b ON b.id = l.id
+    WHERE b.title IS NOT l.title OR b.description IS NOT l.description
+    UNION ALL
+    SELECT 'удалён', 'вопрос', b.id, bs.title, substr(b.question, 1, 80)
+    FROM main.questions b
+    LEFT JOIN main.sections bs ON bs.id = b.section_id
+    WHERE NOT EXISTS (SELECT 1 FROM live.questions l WHERE l.id = b.id)
+    UNION ALL
+    SELECT 'добавлен', 'вопрос', l.id, ls.title, substr(l.question, 1, 80)
+    FROM live.questions l
+    LEFT JOIN live.sections ls ON ls.id = l.section_id
+    WHERE NOT EXISTS (SELECT 1 FROM main.questions b WHERE b.id = l.id)
+    UNION ALL
+    SELECT 'изменён', 'вопрос', l.id, ls.title, substr(l.question, 1, 80)
+    FROM live.questions l
+    JOIN main.questions b ON b.id = l.id
+    LEFT JOIN live.sections ls ON ls.id = l.section_id
+    WHERE b.section_id IS NOT l.section_id OR b.question IS NOT l.question
+       OR b.answer IS NOT l.answer OR b.info IS NOT l.info
+"""
+
+def diff_backup(name):
+    with _extracted(name) as path:
+        # Текущая база подключается только для чтения (имя в виде URI)
+        conn = _connect(f"file:{pathname2url(path)}", uri=True)
+        try:
+            conn.execute("ATTACH DATABASE ? AS live", (f"file:{pathname2url(os.path.abspath(DB_FILE))}?mode=ro",))
+            return read_sql(DIFF_QUERY, conn)
+        finally:
+            conn.close()
+
+# ===== Копии по расписанию =====
+# Фоновый поток процесса: копия снимается, если последняя старше интервала.
+# Копии из других процессов тоже считаются, поэтому процессы не дублируют друг друга.
+class BackupScheduler:
+    def __init__(self, interval_hours):
+        self.interval = interval_hours * 3600
+        self.last_backup = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="knowledge-backup", daemon=True)
+        self._thread.start()
+
+    def _due(self):
+        backups = list_backups()
+        if not backups:
+            return True
+        latest = datetime.strptime(backups[0].created_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - latest).total_seconds() >= self.interval
+
+    def _run(self):
+        while not self._stop.wait(BACKUP_CHECK_INTERVAL):
+            try:
+                if self._due():
+                    self.last_backup = create_backup()
+                    self.last_error = None
+            except BackupBusy:
+                pass
+            except Exception as error:
+                self.last_error = error
+                traceback.print_exc()
+
+    def stop(self):
+        self._stop.set()
+
+@st.cache_resource
+def get_backup_scheduler():
+    if BACKUP_INTERVAL_HOURS <= 0:
+        return None
+    scheduler = BackupScheduler(BACKUP_INTERVAL_HOURS)
+    atexit.register(scheduler.stop)
+    return scheduler
+
+def format_size(size):
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервная копия базы знаний")
+    parser.add_argument("--list", action="store_true", help="показать копии и выйти")
+    args = parser.parse_args()
+
+    if not args.list:
+        backup = create_backup()
+        print(f"Копия {backup.name}: база {format_size(backup.db_size)} → {format_size(backup.size)} "
+              f"за {backup.seconds:.1f} с, шагов {backup.steps}, самый долгий {backup.max_step_ms:.0f} мс")
+    for backup in list_backups():
+        print(f"{backup.created_at}  {format_size(backup.size):>10}  {backup.name}")
+
+if __name__ == "__main__":
+    main()
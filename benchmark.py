@@ -0,0 +1,270 @@
+# Бенчмарк функций доступа к данным на синтетической базе знаний.
+#
+#   python benchmark.py --sections 100 --questions 200000 --output bench_report.json
+#   python benchmark.py --baseline bench_report.json   # сравнить с прошлым прогоном
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+QUIET_LOGGERS = (
+    "streamlit.runtime.caching.cache_data_api",
+    "streamlit.runtime.scriptrunner_utils.script_run_context",
+)
+
+# ===== Синтетические данные =====
+SECTION_WORDS = [
+    "Ввоз", "образцов", "ГТД", "ДС", "сертификация", "декларирование", "маркировка",
+    "таможня", "логистика", "договоры", "оплата", "возвраты", "претензии", "склад",
+    "документы", "лаборатория", "испытания", "протоколы", "экспертиза", "реестр",
+]
+
+WORDS = """
+клиент заявка документ сертификат декларация образец продукция партия протокол
+испытание эксперт макет письмо приказ регистрация соответствие таможня поставка
+договор счет оплата возврат претензия срок инструкция перевод упаковка маркировка
+реестр лаборатория отбор проверка согласование выпуск оформление изготовитель
+заявитель поставщик импорт экспорт код ТН ВЭД технический регламент ЕАЭС схема
+""".split()
+
+CONNECTORS = "и в на по для с без при после до если нужно срочно обязательно".split()
+
+def _sentence(rng, length):
+    words = [rng.choice(WORDS if i % 3 else WORDS + CONNECTORS) for i in range(length)]
+    return " ".join(words).capitalize()
+
+def _text(rng, sentences, words_per_sentence):
+    return ". ".join(_sentence(rng, rng.randint(*words_per_sentence))
+                     for _ in range(rng.randint(*sentences))) + "."
+
+def generate_knowledge_base(path, sections=100, questions=200000, seed=42, batch_size=5000):
+    import db
+    rng = random.Random(seed)
+    db.init_db()
+
+    # Пишем через пул, как приложение (база path — это KNOWLEDGE_DB): поколение
+    # данных и журнал изменений вопросов согласованы, и индексы не
+    # перестраиваются лишний раз
+    with db.write_connection() as conn:
+        conn.executemany(
+            "INSERT INTO sections (title, description, created_at) VALUES (?, ?, datetime('now', ?))",
+            [(f"{' '.join(rng.sample(SECTION_WORDS, 2))} {i + 1}", _sentence(rng, 8), f"-{i} hours")
+             for i in range(sections)],
+        )
+    with db.read_connection() as conn:
+        section_ids = [row[0] for row in conn.execute("SELECT id FROM sections")]
+
+    for start in range(0, questions, batch_size):
+        rows = [(rng.choice(section_ids),
+                 _text(rng, (1, 2), (6, 14)) + "?",
+                 _text(rng, (3, 12), (8, 20)),
+                 _text(rng, (0, 3), (5, 12)) if rng.random() < 0.6 else "",
+                 f"-{rng.randint(0, 365 * 24 * 60)} minutes")
+                for _ in range(min(batch_size, questions - start))]
+        with db.write_connection() as conn:
+            conn.executemany(
+                "INSERT INTO questions (section_id, question, answer, info, created_at) "
+                "VALUES (?, ?, ?, ?, datetime('now', ?))",
+                rows,
+            )
+    with db.write_connection() as conn:
+        conn.execute("ANALYZE")
+    return section_ids
+
+# ===== Замеры =====
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def summarize(samples):
+    return {
+        "runs": len(samples),
+        "mean_ms": sum(samples) / len(samples),
+        "min_ms": min(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples),
+    }
+
+def _elapsed_ms(func, args):
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+# Холодный вызов — после сброса кэшей Streamlit, тёплый — повторный с теми же аргументами
+def measure(func, make_args, runs, clear_caches):
+    cold, warm = [], []
+    for _ in range(runs):
+        args = make_args()
+        clear_caches()
+        cold.append(_elapsed_ms(func, args))
+        warm.append(_elapsed_ms(func, args))
+
+    clear_caches()
+    args = make_args()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cold": summarize(cold), "warm": summarize(warm), "peak_memory_kb": peak / 1024}
+
+def build_cases(rng, section_ids, question_ids):
+    import analytics
+    import db
+    import duplicates
+    import semantic
+    import suggest
+
+    def query():
+        return (" ".join(rng.sample(WORDS, rng.randint(1, 3))),)
+
+    def section():
+        return (rng.choice(section_ids),)
+
+    def question():
+        return (rng.choice(question_ids),)
+
+    return {
+        "get_sections": (db.get_sections, lambda: ()),
+        "get_sections_with_counts": (db.get_sections_with_counts, lambda: ()),
+        "get_section": (db.get_section, section),
+        "get_questions": (db.get_questions, section),
+        "count_questions": (db.count_questions, section),
+        "get_questions_page": (db.get_questions_page, lambda: (rng.choice(section_ids), 0, 21)),
+        "get_question": (db.get_question, question),
+        "get_questions_by_ids": (db.get_questions_by_ids,
+                                 lambda: (tuple(rng.sample(question_ids, 20)),)),
+        "search_questions": (db.search_questions, query),
+        "similar_questions": (semantic.similar_questions, query),
+        "suggest_questions": (suggest.suggest_questions, query),
+        "find_duplicates": (duplicates.find_duplicates, lambda: (" ".join(rng.sample(WORDS, 8)),)),
+        "record_search": (analytics.record_search, lambda: (*query(), "words", rng.randint(0, 50))),
+        "popular_queries": (analytics.popular_queries, lambda: (rng.choice(WORDS)[:3],)),
+        "get_recent_sections": (db.get_recent_sections, lambda: (3,)),
+        "get_recent_questions": (db.get_recent_questions, lambda: (5,)),
+        "get_total_stats": (db.get_total_stats, lambda: ()),
+        "get_home_summary": (db.get_home_summary, lambda: (3, 5)),
+    }
+
+# Сравнение с прошлым отчётом: функции, у которых p95 холодного вызова вырос
+def find_regressions(report, baseline, threshold):
+    regressions = []
+    for name, result in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        before, after = previous["cold"]["p95_ms"], result["cold"]["p95_ms"]
+        if before > 0 and after > before * threshold:
+            regressions.append((name, before, after))
+    return regressions
+
+def print_table(results):
+    print(f"{'функция':<26}{'cold p50':>10}{'cold p95':>10}{'cold p99':>10}"
+          f"{'warm p50':>10}{'warm p99':>10}{'пик, КБ':>10}")
+    for name, result in results.items():
+        cold, warm = result["cold"], result["warm"]
+        print(f"{name:<26}{cold['p50_ms']:>10.2f}{cold['p95_ms']:>10.2f}{cold['p99_ms']:>10.2f}"
+              f"{warm['p50_ms']:>10.3f}{warm['p99_ms']:>10.3f}{result['peak_memory_kb']:>10.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк функций доступа к базе знаний")
+    parser.add_argument("--sections", type=int, default=100)
+    parser.add_argument("--questions", type=int, default=200000)
+    parser.add_argument("--runs", type=int, default=30, help="замеров на каждую функцию")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="файл синтетической базы (по умолчанию временный)")
+    parser.add_argument("--reuse", action="store_true", help="не пересоздавать базу, если файл уже есть")
+    parser.add_argument("--only", nargs="*", help="замерить только указанные функции")
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--baseline", help="прошлый отчёт для поиска регрессий")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="допустимый рост p95 относительно baseline")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="kb-bench-"), "knowledge.db")
+    if os.path.exists(path) and not args.reuse:
+        os.remove(path)
+    # Модули базы читают путь при импорте
+    os.environ["KNOWLEDGE_DB"] = path
+
+    # Без сервера Streamlit предупреждает о каждом кэше — в отчёте это шум
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).disabled = True
+
+    import streamlit as st
+    import db
+    import suggest
+
+    generate_started = time.perf_counter()
+    if not (args.reuse and os.path.exists(path)):
+        print(f"Генерируем базу: {args.sections} разделов, {args.questions} вопросов → {path}")
+        generate_knowledge_base(path, args.sections, args.questions, args.seed)
+    else:
+        db.init_db()
+    generate_seconds = time.perf_counter() - generate_started
+
+    with db.read_connection() as conn:
+        section_ids = [row[0] for row in conn.execute("SELECT id FROM sections")]
+        question_ids = [row[0] for row in conn.execute("SELECT id FROM questions")]
+
+    rng = random.Random(args.seed)
+    cases = build_cases(rng, section_ids, question_ids)
+    if args.only:
+        cases = {name: case for name, case in cases.items() if name in args.only}
+
+    def clear_caches():
+        st.cache_data.clear()
+        suggest.clear_results()
+
+    results = {}
+    for name, (func, make_args) in cases.items():
+        # Первый вызов прогревает ленивые ресурсы (пул, индексы в памяти)
+        func(*make_args())
+        results[name] = measure(func, make_args, args.runs, clear_caches)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "sections": len(section_ids),
+            "questions": len(question_ids),
+            "runs": args.runs,
+            "seed": args.seed,
+            "generate_seconds": generate_seconds,
+            "db_size_mb": os.path.getsize(path) / 2 ** 20,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_table(results)
+    print(f"Отчёт: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = find_regressions(report, json.load(f), args.threshold)
+        for name, before, after in regressions:
+            print(f"РЕГРЕССИЯ {name}: p95 {before:.2f} → {after:.2f} мс")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,922 @@
+import atexit
+import functools
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import streamlit as st
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from metrics import get_metrics
+from models import Question, QuestionTitle, SearchPage, Section, Summary
+
+# Путь к базе можно переопределить переменной окружения (бенчмарки, тесты)
+DB_FILE = os.environ.get("KNOWLEDGE_DB", "knowledge.db")
+
+# Размер пула соединений на чтение
+READ_POOL_SIZE = 8
+
+# Режим для нагрузки «много читателей, мало писателей»: чтение идёт из копии
+# базы в памяти, которая обновляется после записи (KNOWLEDGE_READ_SNAPSHOT=1).
+# Каждое соединение на чтение держит свою копию: память — размер базы × READ_POOL_SIZE
+READ_SNAPSHOT = os.environ.get("KNOWLEDGE_READ_SNAPSHOT") == "1"
+
+# Несколько процессов приложения на одной базе (KNOWLEDGE_MULTIPROCESS=1):
+# процесс следит за файлами базы и сбрасывает кэши после записи в другом процессе
+MULTIPROCESS = os.environ.get("KNOWLEDGE_MULTIPROCESS") == "1"
+
+# Длина заголовка вопроса в списках (полный текст читается отдельно)
+TITLE_LENGTH = 80
+
+# Сколько вариантов ответа хранит кэш каждой читающей функции
+CACHE_MAX_ENTRIES = 256
+
+# Журнал изменений вопросов: сколько поколений данных хранить и сколько
+# изменённых вопросов отдавать за раз (больше — индекс проще перестроить)
+CHANGE_LOG_VERSIONS = 10000
+QUESTION_CHANGES_LIMIT = 1000
+
+# Очередь записи: сколько операций объединять в одну транзакцию
+# и сколько ждать попутных операций после первой, с
+WRITE_BATCH_SIZE = 100
+WRITE_BATCH_WAIT = 0.005
+
+# Настройки, которые применяются к каждому соединению
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -65536",    # 64 МБ страничного кэша
+    "PRAGMA mmap_size = 268435456",  # 256 МБ отображения файла в память
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
+
+# Соединения на чтение: открываются лениво, None в очереди — свободный слот
+class ReaderPool:
+    def __init__(self, connect, size=READ_POOL_SIZE):
+        self._connect = connect
+        self._readers = queue.LifoQueue()
+        for _ in range(size):
+            self._readers.put(None)
+    
+    @contextmanager
+    def read(self):
+        conn = self._readers.get()
+        try:
+            if conn is None:
+                conn = self._connect()
+            yield conn
+        finally:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+# Копия базы в памяти: образ базы снимается один раз (serialize), и каждое
+# соединение на чтение получает из него свою базу в памяти (deserialize).
+# Отдельные копии не делят блокировки общего кэша SQLite между потоками.
+# Старая копия освобождается, когда читатели вернут её соединения.
+class Snapshot:
+    def __init__(self, source, generation, read_pool_size=READ_POOL_SIZE):
+        self.generation = generation
+        image = bytearray(source.serialize())
+        # Байты 18–19 заголовка — режим журнала; копия в памяти не может быть в WAL
+        image[18:20] = b"\x01\x01"
+        self._image = bytes(image)
+        self._readers = ReaderPool(self._connect, read_pool_size)
+    
+    def _connect(self):
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        conn.deserialize(self._image)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+    
+    def read(self):
+        return self._readers.read()
+
+# Пул соединений: несколько читателей и один писатель на весь процесс.
+# В режиме WAL читатели не блокируют запись и наоборот.
+# С snapshot=True читатели работают с копией базы в памяти; копия
+# пересоздаётся при первом чтении после записи, подмена атомарна.
+class ConnectionPool:
+    def __init__(self, db_file, read_pool_size=READ_POOL_SIZE, snapshot=False):
+        self.db_file = db_file
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        # Поколение данных — счётчик data_version в самой базе: растёт после
+        # каждой записи, поэтому одинаково во всех процессах
+        self.generation = self._read_version()
+        self._read_pool_size = read_pool_size
+        self._readers = ReaderPool(lambda: self._connect(read_only=True), read_pool_size)
+        
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+        if snapshot:
+            self._snapshot = self._take_snapshot()
+    
+    def _connect(self, read_only=False):
+        conn = sqlite3.connect(self.db_file, timeout=5, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+    
+    # Образ снимается с отдельного соединения на чтение,
+    # поэтому видит только зафиксированные данные и не мешает записи
+    def _take_snapshot(self):
+        generation = self.generation
+        with self._readers.read() as source:
+            return Snapshot(source, generation, self._read_pool_size)
+    
+    def _current_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot.generation != self.generation:
+            with self._snapshot_lock:
+                if self._snapshot.generation != self.generation:
+                    self._snapshot = self._take_snapshot()
+                snapshot = self._snapshot
+        return snapshot
+    
+    def read(self):
+        if self._snapshot is not None:
+            return self._current_snapshot().read()
+        return self._readers.read()
+    
+    # Чтение, где все запросы видят один снимок базы:
+    # поколение и данные читаются согласованно
+    @contextmanager
+    def read_transaction(self):
+        with self.read() as conn:
+            conn.execute("BEGIN")
+            yield conn
+    
+    # Всё, что сделано внутри write(), — одна транзакция вместе с новым
+    # поколением: другие процессы видят изменения и поколение одновременно
+    @contextmanager
+    def write(self):
+        with self._write_lock:
+            changes_before = self._writer.total_changes
+            try:
+                self._writer.execute("BEGIN IMMEDIATE")
+                yield self._writer
+                # Поколение меняется только если строки действительно изменились
+                version = None
+                if self._writer.total_changes != changes_before:
+                    version = self._writer.execute(
+                        "UPDATE data_version SET version = version + 1 RETURNING version").fetchone()[0]
+                    self._writer.execute("DELETE FROM question_changes WHERE version <= ?",
+                                         (version - CHANGE_LOG_VERSIONS,))
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+            if version is not None:
+                self.generation = version
+    
+    def _read_version(self):
+        return self._writer.execute("SELECT version FROM data_version").fetchone()[0]
+    
+    # Замена всей базы копией (восстановление из резервной копии). Копия
+    # пишется через writer под блокировкой записи; поколение продолжает расти,
+    # чтобы кэши прежних поколений не ожили со старыми данными.
+    def restore(self, source):
+        with self._write_lock:
+            version = self._read_version()
+            source.backup(self._writer)
+            # Копия могла быть снята со старой схемой
+            migrate(self.db_file)
+            self.generation = self._writer.execute(
+                "UPDATE data_version SET version = MAX(version, ?) + 1 RETURNING version", (version,)).fetchone()[0]
+            # В журнале изменений — отметка «изменилось всё»
+            self._writer.execute("INSERT INTO question_changes (version, question_id) VALUES (?, NULL)",
+                                 (self.generation,))
+            self._writer.commit()
+    
+    # Подхватить запись из другого процесса; True, если данные изменились
+    def refresh_generation(self):
+        with self._write_lock:
+            version = self._read_version()
+            if version == self.generation:
+                return False
+            self.generation = version
+            return True
+
+# Слежение за файлами базы (watchdog): запись из другого процесса меняет
+# файл базы или её WAL-журнал. Тогда поколение перечитывается из data_version:
+# кэши читающих функций сбрасываются сами, а индексы в памяти догонят базу
+# по журналу question_changes при следующем запросе.
+class DatabaseWatcher(FileSystemEventHandler):
+    def __init__(self, pool):
+        self._pool = pool
+        db_file = os.path.abspath(pool.db_file)
+        self._paths = {db_file, f"{db_file}-wal"}
+        self._observer = Observer()
+        self._observer.daemon = True
+        self._observer.schedule(self, os.path.dirname(db_file))
+    
+    def start(self):
+        self._observer.start()
+    
+    def stop(self):
+        self._observer.stop()
+        self._observer.join()
+    
+    def on_any_event(self, event):
+        if event.is_directory or os.path.abspath(event.src_path) not in self._paths:
+            return
+        self._pool.refresh_generation()
+
+# ===== Миграции схемы =====
+# Версия схемы хранится в PRAGMA user_version. Недостающие миграции выполняются
+# по порядку в одной транзакции; новые шаги добавляются только в конец списка.
+# Первые шаги идемпотентны, чтобы подхватить базы, созданные до миграций.
+
+# В индекс текст попадает с «ё», заменённой на «е» (unicode61 их не
+# отождествляет), build_fts_query делает ту же замену в запросе. Замена
+# посимвольная, поэтому snippet по исходному тексту подсвечивает те же слова.
+# Индекс заполняется только через _fold_yo: команда 'rebuild' взяла бы текст как есть.
+def _fold_yo(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+def _fts_values(row):
+    return ", ".join(_fold_yo(f"{row}.{column}") for column in ("question", "answer", "info"))
+
+def _create_fts_triggers(conn):
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN
+                       INSERT INTO questions_fts (rowid, question, answer, info)
+                       VALUES (new.id, {_fts_values("new")});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN
+                       INSERT INTO questions_fts (questions_fts, rowid, question, answer, info)
+                       VALUES ('delete', old.id, {_fts_values("old")});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS questions_fts_au AFTER UPDATE ON questions BEGIN
+                       INSERT INTO questions_fts (questions_fts, rowid, question, answer, info)
+                       VALUES ('delete', old.id, {_fts_values("old")});
+                       INSERT INTO questions_fts (rowid, question, answer, info)
+                       VALUES (new.id, {_fts_values("new")});
+                     END''')
+
+def _create_question_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_section ON questions (section_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_created ON questions (created_at)")
+
+# 1. Основные таблицы
+def _migration_base_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS sections
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     title TEXT NOT NULL,
+                     description TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS questions
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     section_id INTEGER,
+                     question TEXT NOT NULL,
+                     answer TEXT,
+                     info TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     FOREIGN KEY (section_id) REFERENCES sections (id))''')
+
+# 2. Полнотекстовый индекс по вопросам (unicode61 без учёта регистра, в том числе для кириллицы)
+def _migration_fts(conn):
+    fts_exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'").fetchone()
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5
+                    (question, answer, info,
+                     content='questions', content_rowid='id',
+                     tokenize='unicode61 remove_diacritics 2')''')
+    _create_fts_triggers(conn)
+    if not fts_exists:
+        conn.execute("INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')")
+
+# 3. Индексы для выборок по разделу и списков недавних записей
+def _migration_indexes(conn):
+    _create_question_indexes(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sections_created ON sections (created_at)")
+
+# 4. Вопросы удаляются вместе с разделом (ON DELETE CASCADE).
+# SQLite не умеет менять внешний ключ, поэтому таблица пересобирается.
+# Старые базы работали без проверки внешних ключей, и в них бывают вопросы
+# удалённых разделов — такие вопросы переносятся в раздел «Без раздела».
+ORPHAN_SECTION_TITLE = "Без раздела"
+
+def _adopt_orphan_questions(conn):
+    orphans = '''section_id IS NOT NULL
+                 AND section_id NOT IN (SELECT id FROM sections)'''
+    if not conn.execute(f"SELECT 1 FROM questions WHERE {orphans} LIMIT 1").fetchone():
+        return
+    section_id = conn.execute("INSERT INTO sections (title, description) VALUES (?, ?)",
+                              (ORPHAN_SECTION_TITLE,
+                               "Вопросы удалённых разделов, найденные при обновлении базы")).lastrowid
+    conn.execute(f"UPDATE questions SET section_id = ? WHERE {orphans}", (section_id,))
+
+def _migration_cascade_delete(conn):
+    _adopt_orphan_questions(conn)
+    conn.execute('''CREATE TABLE questions_new
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     section_id INTEGER REFERENCES sections (id) ON DELETE CASCADE,
+                     question TEXT NOT NULL,
+                     answer TEXT,
+                     info TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute('''INSERT INTO questions_new (id, section_id, question, answer, info, created_at)
+                    SELECT id, section_id, question, answer, info, created_at FROM questions''')
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'questions'").fetchone()
+    conn.execute("DROP TABLE questions")
+    conn.execute("ALTER TABLE questions_new RENAME TO questions")
+    if sequence:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'questions'", sequence)
+    # Вместе со старой таблицей удалились её триггеры и индексы
+    _create_fts_triggers(conn)
+    _create_question_indexes(conn)
+
+# 5. Сводка для главной страницы: общие количества и число вопросов
+# по разделам поддерживаются триггерами, а не считаются COUNT(*) на каждом показе
+def _migration_summary(conn):
+    conn.execute('''CREATE TABLE summary
+                    (id INTEGER PRIMARY KEY CHECK (id = 1),
+                     sections INTEGER NOT NULL,
+                     questions INTEGER NOT NULL,
+                     updated_at TIMESTAMP)''')
+    conn.execute('''CREATE TABLE section_stats
+                    (section_id INTEGER PRIMARY KEY,
+                     question_count INTEGER NOT NULL DEFAULT 0,
+                     updated_at TIMESTAMP)''')
+    conn.execute('''INSERT INTO summary (id, sections, questions, updated_at)
+                    SELECT 1,
+                           (SELECT COUNT(*) FROM sections),
+                           (SELECT COUNT(*) FROM questions),
+                           MAX((SELECT MAX(created_at) FROM sections), (SELECT MAX(created_at) FROM questions))''')
+    conn.execute('''INSERT INTO section_stats (section_id, question_count, updated_at)
+                    SELECT s.id, COUNT(q.id), MAX(s.created_at, COALESCE(MAX(q.created_at), s.created_at))
+                    FROM sections s
+                    LEFT JOIN questions q ON q.section_id = s.id
+                    GROUP BY s.id''')
+    
+    conn.execute('''CREATE TRIGGER summary_sections_ai AFTER INSERT ON sections BEGIN
+                      INSERT INTO section_stats (section_id, updated_at) VALUES (new.id, CURRENT_TIMESTAMP);
+                      UPDATE summary SET sections = sections + 1, updated_at = CURRENT_TIMESTAMP;
+                    END''')
+    conn.execute('''CREATE TRIGGER summary_sections_ad AFTER DELETE ON sections BEGIN
+                      DELETE FROM section_stats WHERE section_id = old.id;
+                      UPDATE summary SET sections = sections - 1, updated_at = CURRENT_TIMESTAMP;
+                    END''')
+    conn.execute('''CREATE TRIGGER summary_sections_au AFTER UPDATE ON sections BEGIN
+                      UPDATE section_stats SET updated_at = CURRENT_TIMESTAMP WHERE section_id = new.id;
+                      UPDATE summary SET updated_at = CURRENT_TIMESTAMP;
+                    END''')
+    conn.execute('''CREATE TRIGGER summary_questions_ai AFTER INSERT ON questions BEGIN
+                      UPDATE section_stats SET question_count = question_count + 1, updated_at = CURRENT_TIMESTAMP
+                      WHERE section_id = new.section_id;
+                      UPDATE summary SET questions = questions + 1, updated_at = CURRENT_TIMESTAMP;
+                    END''')
+    conn.execute('''CREATE TRIGGER summary_questions_ad AFTER DELETE ON questions BEGIN
+                      UPDATE section_stats SET question_count = question_count - 1, updated_at = CURRENT_TIMESTAMP
+                      WHERE section_id = old.section_id;
+                      UPDATE summary SET questions = questions - 1, updated_at = CURRENT_TIMESTAMP;
+                    END''')
+    conn.execute('''CREATE TRIGGER summary_questions_au AFTER UPDATE ON questions BEGIN
+                      UPDATE section_stats SET question_count = question_count - 1
+                      WHERE section_id = old.section_id AND old.section_id IS NOT new.section_id;
+                      UPDATE section_stats SET question_count = question_count + 1
+                      WHERE section_id = new.section_id AND old.section_id IS NOT new.section_id;
+                      UPDATE section_stats SET updated_at = CURRENT_TIMESTAMP
+                      WHERE section_id IN (old.section_id, new.section_id);
+                      UPDATE summary SET updated_at = CURRENT_TIMESTAMP;
+                    END''')
+
+# 6. Общий для всех процессов счётчик изменений данных (поколение кэша)
+def _migration_data_version(conn):
+    conn.execute('''CREATE TABLE data_version
+                    (id INTEGER PRIMARY KEY CHECK (id = 1),
+                     version INTEGER NOT NULL)''')
+    conn.execute("INSERT INTO data_version (id, version) VALUES (1, 0)")
+
+# 7. Журнал поиска (analytics.py): события копятся в search_events и search_clicks,
+# периодически сводятся в search_query_stats и search_click_stats.
+# search_log_state помнит последние сведённые события; AUTOINCREMENT —
+# чтобы номера не начались заново, когда старые события удалены.
+def _migration_search_log(conn):
+    conn.execute('''CREATE TABLE search_events
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     searched_at TIMESTAMP NOT NULL,
+                     query TEXT NOT NULL,
+                     kind TEXT NOT NULL,
+                     results INTEGER NOT NULL)''')
+    conn.execute('''CREATE TABLE search_clicks
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     clicked_at TIMESTAMP NOT NULL,
+                     query TEXT NOT NULL,
+                     question_id INTEGER NOT NULL)''')
+    conn.execute('''CREATE TABLE search_query_stats
+                    (query TEXT PRIMARY KEY,
+                     searches INTEGER NOT NULL DEFAULT 0,
+                     empty_searches INTEGER NOT NULL DEFAULT 0,
+                     clicks INTEGER NOT NULL DEFAULT 0,
+                     last_searched_at TIMESTAMP)''')
+    conn.execute('''CREATE TABLE search_click_stats
+                    (query TEXT NOT NULL,
+                     question_id INTEGER NOT NULL,
+                     clicks INTEGER NOT NULL,
+                     PRIMARY KEY (query, question_id))''')
+    conn.execute("CREATE INDEX idx_search_click_stats_question ON search_click_stats (question_id)")
+    conn.execute('''CREATE TABLE search_log_state
+                    (id INTEGER PRIMARY KEY CHECK (id = 1),
+                     events_id INTEGER NOT NULL,
+                     clicks_id INTEGER NOT NULL,
+                     aggregated_at TIMESTAMP)''')
+    conn.execute("INSERT INTO search_log_state (id, events_id, clicks_id) VALUES (1, 0, 0)")
+
+# 8. Журнал изменений вопросов: какие вопросы менялись в каждом поколении
+# data_version. Триггеры пишут поколение, которое зафиксирует текущая запись
+# (ConnectionPool.write увеличивает его в той же транзакции). По журналу другие
+# процессы и сохранённые на диск индексы узнают, что изменилось с известного
+# им поколения. question_id = NULL — изменилось всё (до журнала, восстановление).
+def _migration_question_changes(conn):
+    conn.execute('''CREATE TABLE question_changes
+                    (version INTEGER NOT NULL,
+                     question_id INTEGER)''')
+    conn.execute("CREATE INDEX idx_question_changes_version ON question_changes (version)")
+    for event, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+        conn.execute(f'''CREATE TRIGGER question_changes_{event.lower()} AFTER {event} ON questions BEGIN
+                           INSERT INTO question_changes (version, question_id)
+                           SELECT version + 1, {row}.id FROM data_version;
+                         END''')
+    conn.execute("INSERT INTO question_changes (version, question_id) SELECT version, NULL FROM data_version")
+
+# 9. Поиск не различает «е» и «ё»: индекс перестраивается по тексту с заменой
+def _migration_fold_yo(conn):
+    for trigger in ("questions_fts_ai", "questions_fts_ad", "questions_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    _create_fts_triggers(conn)
+    conn.execute("INSERT INTO questions_fts (questions_fts) VALUES ('delete-all')")
+    conn.execute(f"""INSERT INTO questions_fts (rowid, question, answer, info)
+                     SELECT id, {_fts_values("questions")} FROM questions""")
+
+MIGRATIONS = [
+    _migration_base_tables,
+    _migration_fts,
+    _migration_indexes,
+    _migration_cascade_delete,
+    _migration_summary,
+    _migration_data_version,
+    _migration_search_log,
+    _migration_question_changes,
+    _migration_fold_yo,
+]
+
+def migrate(db_file):
+    # Отдельное соединение без foreign_keys: пересборка таблиц требует их отключения
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        # Пересборка таблиц идёт без проверки внешних ключей — проверяем в конце.
+        # Миграции сами чинят известные нарушения, это последняя страховка
+        orphans = conn.execute("PRAGMA foreign_key_check").fetchall()
+        if orphans:
+            raise sqlite3.IntegrityError(f"Нарушены внешние ключи после миграции: {orphans[:10]}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+# Пул создаётся один раз на процесс, до этого база приводится к последней версии схемы
+@st.cache_resource
+def get_pool():
+    migrate(DB_FILE)
+    pool = ConnectionPool(DB_FILE, snapshot=READ_SNAPSHOT)
+    if MULTIPROCESS:
+        DatabaseWatcher(pool).start()
+    return pool
+
+# Подготовка базы (для скриптов; приложению достаточно первого обращения к пулу)
+def init_db():
+    get_pool()
+
+# Контекстные менеджеры для работы с БД
+def read_connection():
+    return get_pool().read()
+
+def write_connection():
+    return get_pool().write()
+
+def data_generation():
+    return get_pool().generation
+
+def read_transaction():
+    return get_pool().read_transaction()
+
+# Вопросы, изменённые после поколения since: (текущее поколение, изменения).
+# Изменения — список пар (question_id, (question, answer, info)), для удалённых
+# вопросов вместо текста None. Вместо списка None, если журнал не покрывает
+# этот период или вопросов больше limit. conn — из read_transaction.
+def question_changes_since(conn, since, limit=QUESTION_CHANGES_LIMIT):
+    version = conn.execute("SELECT version FROM data_version").fetchone()[0]
+    if since > version or version - since >= CHANGE_LOG_VERSIONS:
+        return version, None
+    rows = conn.execute('''SELECT c.question_id, q.question, q.answer, q.info
+                           FROM (SELECT DISTINCT question_id FROM question_changes
+                                 WHERE version > ? LIMIT ?) c
+                           LEFT JOIN questions q ON q.id = c.question_id''', (since, limit + 1)).fetchall()
+    if len(rows) > limit or any(question_id is None for question_id, *_ in rows):
+        return version, None
+    return version, [(question_id, None if question is None else (question, answer, info))
+                     for question_id, question, answer, info in rows]
+
+# Восстановление базы из копии: отметка в журнале изменений заставит
+# индексы в памяти перестроиться целиком
+def restore_database(source):
+    get_pool().restore(source)
+
+# Отдельное соединение для служебной записи (журнал поиска): она идёт мимо
+# очереди записи, не меняет поколение данных и не сбрасывает кэши
+def open_connection():
+    return get_pool()._connect()
+
+# Очередь записи: один фоновый поток выполняет все изменения по порядку
+# и объединяет накопившиеся операции в одну транзакцию. Каждая операция
+# получает свою точку сохранения внутри этой транзакции, поэтому ошибка
+# в одной не откатывает остальные. submit() возвращает Future с результатом операции.
+# Операция — функция operation(conn, *args); индексы в памяти узнают об
+# изменениях сами, по журналу question_changes.
+class WriteQueue:
+    def __init__(self, pool):
+        self._pool = pool
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="knowledge-writer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, operation, *args):
+        future = Future()
+        self._queue.put((operation, args, future))
+        return future
+    
+    # Дождаться выполнения уже поставленных операций и остановить поток
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + WRITE_BATCH_WAIT
+        while batch[-1] is not None and len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            try:
+                self._apply([item for item in batch if item[2].set_running_or_notify_cancel()])
+            except Exception:
+                # Поток записи не должен умирать из-за одной пачки
+                traceback.print_exc()
+            if stop:
+                return
+    
+    def _apply(self, batch):
+        if not batch:
+            return
+        outcomes = []
+        try:
+            with self._pool.write() as conn:
+                for operation, args, future in batch:
+                    conn.execute("SAVEPOINT operation")
+                    try:
+                        result = operation(conn, *args)
+                    except Exception as error:
+                        conn.execute("ROLLBACK TO operation")
+                        outcomes.append((future, None, error))
+                    else:
+                        outcomes.append((future, result, None))
+                    conn.execute("RELEASE operation")
+        except BaseException as error:
+            # Не удалось зафиксировать транзакцию — не выполнена ни одна операция
+            for _, _, future in batch:
+                future.set_exception(error)
+            raise
+        
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+@st.cache_resource
+def get_write_queue():
+    write_queue = WriteQueue(get_pool())
+    atexit.register(write_queue.close)
+    return write_queue
+
+# Признак промаха кэша в текущем потоке (для метрик)
+_cache_state = threading.local()
+
+# Кэш для читающих функций: ключом служит поколение данных, поэтому
+# результат живёт, пока данные не изменятся, и сбрасывается сразу после записи.
+# Первый аргумент функции (generation) подставляется автоматически.
+def versioned_cache(func):
+    @functools.wraps(func)
+    def load(*args, **kwargs):
+        _cache_state.miss = True
+        return func(*args, **kwargs)
+    
+    cached = st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)(load)
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _cache_state.miss = False
+        started = time.perf_counter()
+        result = cached(data_generation(), *args, **kwargs)
+        get_metrics().record_call(func.__name__, (time.perf_counter() - started) * 1000,
+                                  hit=not _cache_state.miss)
+        return result
+    
+    return wrapper
+
+# Выполнение запроса с замером: время SQL и время сборки результата
+# попадают в метрики раздельно. build(columns, rows) собирает результат.
+def _timed_fetch(query, conn, params, build):
+    started = time.perf_counter()
+    cursor = conn.execute(query, params)
+    rows = cursor.fetchall()
+    fetched = time.perf_counter()
+    result = build([column[0] for column in cursor.description], rows)
+    get_metrics().record_query(query, len(rows), (fetched - started) * 1000,
+                               (time.perf_counter() - fetched) * 1000)
+    return result
+
+# Список записей (models) — для всего, что показывается в интерфейсе
+def read_records(query, conn, record, params=()):
+    return _timed_fetch(query, conn, params, record.from_rows)
+
+# Одна запись или None
+def read_record(query, conn, record, params=()):
+    records = read_records(query, conn, record, params)
+    return records[0] if records else None
+
+# Аналог pd.read_sql — только там, где нужна таблица целиком.
+# pandas импортируется при первом вызове, а не при запуске приложения.
+def read_sql(query, conn, params=()):
+    import pandas as pd
+    return _timed_fetch(query, conn, params,
+                        lambda columns, rows: pd.DataFrame.from_records(rows, columns=columns))
+
+# Одно значение из запроса (COUNT и т.п.) без DataFrame
+def fetch_value(conn, query, params=()):
+    started = time.perf_counter()
+    value = conn.execute(query, params).fetchone()[0]
+    get_metrics().record_query(query, 1, (time.perf_counter() - started) * 1000)
+    return value
+
+# Функции для работы с БД
+@versioned_cache
+def get_sections(generation):
+    with read_connection() as conn:
+        return read_records("SELECT * FROM sections ORDER BY title", conn, Section)
+
+# Разделы вместе с количеством вопросов — одним запросом
+@versioned_cache
+def get_sections_with_counts(generation):
+    with read_connection() as conn:
+        query = """
+        SELECT s.*, st.question_count
+        FROM sections s
+        JOIN section_stats st ON st.section_id = s.id
+        ORDER BY s.title
+        """
+        return read_records(query, conn, Section)
+
+# Все вопросы раздела таблицей (DataFrame)
+@versioned_cache
+def get_questions(generation, section_id):
+    with read_connection() as conn:
+        return read_sql("SELECT * FROM questions WHERE section_id = ? ORDER BY id", 
+                          conn, params=(section_id,))
+
+# Количество вопросов в разделе из сводки (без COUNT по таблице вопросов)
+@versioned_cache
+def count_questions(generation, section_id):
+    with read_connection() as conn:
+        return fetch_value(conn, "SELECT COALESCE(MAX(question_count), 0) FROM section_stats WHERE section_id = ?",
+                           (section_id,))
+
+# Страница вопросов раздела: keyset-пагинация по id, читаем только нужные строки
+@versioned_cache
+def get_questions_page(generation, section_id, after_id=0, limit=20):
+    with read_connection() as conn:
+        query = """
+        SELECT id, section_id, substr(question, 1, ?) as title
+        FROM questions
+        WHERE section_id = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+        """
+        return read_records(query, conn, QuestionTitle, params=(TITLE_LENGTH, section_id, after_id, limit))
+
+# Полный текст одного вопроса — для раскрытого элемента списка
+@versioned_cache
+def get_question(generation, question_id):
+    with read_connection() as conn:
+        query = """
+        SELECT q.*, s.title as section_title
+        FROM questions q
+        LEFT JOIN sections s ON q.section_id = s.id
+        WHERE q.id = ?
+        """
+        return read_record(query, conn, Question, params=(question_id,))
+
+# Превращаем ввод пользователя в запрос FTS5: каждое слово ищется по префиксу,
+# «ё» заменяется на «е», как в индексе
+def build_fts_query(search_text):
+    terms = re.findall(r"\w+", search_text.lower().replace("ё", "е"))
+    return " ".join(f'"{term}"*' for term in terms)
+
+# Сборка SearchPage: первые три колонки (разделы, всего, найдено) одинаковы
+# во всех строках, остальные — вопрос страницы (пусто, если страница пуста)
+def _search_page(columns, rows):
+    facets, total, found = rows[0][:3]
+    return SearchPage(
+        total=total,
+        found=found,
+        facets=[Section(id=section_id, title=title, question_count=hits)
+                for section_id, title, hits in json.loads(facets)],
+        results=QuestionTitle.from_rows(columns[3:], [row[3:] for row in rows if row[3] is not None]),
+    )
+
+# Одна страница результатов поиска (offset-пагинация) и счётчики по разделам.
+# Совпадения вычисляются один раз (MATERIALIZED) и дают и разделы, и страницу;
+# фрагмент с подсветкой строится только для вопросов страницы.
+@versioned_cache
+def search_questions(generation, search_text, section_id=None, offset=0, limit=20):
+    fts_query = build_fts_query(search_text)
+    if not fts_query:
+        return SearchPage(total=0, found=0, facets=[], results=[])
+    with read_connection() as conn:
+        query = """
+        WITH hits AS MATERIALIZED (
+            SELECT q.id, q.section_id, bm25(questions_fts) as rank
+            FROM questions_fts
+            JOIN questions q ON q.id = questions_fts.rowid
+            WHERE questions_fts MATCH :match
+        ),
+        facets AS (
+            SELECT json_group_array(json_array(s.id, s.title, f.hits)) as facets,
+                   COALESCE(SUM(f.hits), 0) as total,
+                   COALESCE(SUM(CASE WHEN :section_id IS NULL OR s.id = :section_id THEN f.hits END), 0) as found
+            FROM (SELECT section_id, COUNT(*) as hits FROM hits GROUP BY section_id
+                  ORDER BY hits DESC, section_id) f
+            JOIN sections s ON s.id = f.section_id
+        ),
+        page AS (
+            SELECT id, rank FROM hits
+            WHERE :section_id IS NULL OR section_id = :section_id
+            ORDER BY rank, id
+            LIMIT :limit OFFSET :offset
+        )
+        SELECT f.facets, f.total, f.found,
+               q.id, q.section_id, substr(q.question, 1, :title_length) as title, s.title as section_title,
+               (SELECT snippet(questions_fts, -1, '**', '**', '…', 16) FROM questions_fts
+                WHERE questions_fts MATCH :match AND rowid = p.id) as snippet
+        FROM facets f
+        LEFT JOIN page p
+        LEFT JOIN questions q ON q.id = p.id
+        LEFT JOIN sections s ON s.id = q.section_id
+        ORDER BY p.rank, p.id
+        """
+        params = {"match": fts_query, "section_id": section_id, "offset": offset, "limit": limit,
+                  "title_length": TITLE_LENGTH}
+        return _timed_fetch(query, conn, params, _search_page)
+
+# Заголовки вопросов по списку id в том же порядке (для ранжированной выдачи)
+@versioned_cache
+def get_questions_by_ids(generation, question_ids):
+    if not question_ids:
+        return []
+    with read_connection() as conn:
+        placeholders = ", ".join("?" * len(question_ids))
+        query = f"""
+        SELECT q.id, q.section_id, substr(q.question, 1, ?) as title, s.title as section_title
+        FROM questions q
+        JOIN sections s ON q.section_id = s.id
+        WHERE q.id IN ({placeholders})
+        """
+        questions = read_records(query, conn, QuestionTitle, params=(TITLE_LENGTH, *question_ids))
+    order = {question_id: position for position, question_id in enumerate(question_ids)}
+    return sorted(questions, key=lambda question: order[question.id])
+
+def _recent_sections(conn, limit):
+    query = """
+    SELECT s.*, st.question_count
+    FROM sections s
+    JOIN section_stats st ON st.section_id = s.id
+    ORDER BY s.created_at DESC
+    LIMIT ?
+    """
+    return read_records(query, conn, Section, params=(limit,))
+
+def _recent_questions(conn, limit):
+    query = """
+    SELECT q.id, q.section_id, substr(q.question, 1, ?) as title,
+           q.created_at, s.title as section_title
+    FROM questions q
+    JOIN sections s ON q.section_id = s.id
+    ORDER BY q.created_at DESC 
+    LIMIT ?
+    """
+    return read_records(query, conn, QuestionTitle, params=(TITLE_LENGTH, limit))
+
+@versioned_cache
+def get_recent_sections(generation, limit=5):
+    with read_connection() as conn:
+        return _recent_sections(conn, limit)
+
+@versioned_cache
+def get_recent_questions(generation, limit=5):
+    with read_connection() as conn:
+        return _recent_questions(conn, limit)
+
+@versioned_cache
+def get_section(generation, section_id):
+    with read_connection() as conn:
+        return read_record("SELECT * FROM sections WHERE id = ?", conn, Section, params=(section_id,))
+
+@versioned_cache
+def get_total_stats(generation):
+    with read_connection() as conn:
+        summary = read_record("SELECT * FROM summary", conn, Summary)
+        return summary.sections, summary.questions
+
+# Всё для главной страницы за одно обращение: сводка и последние записи
+@versioned_cache
+def get_home_summary(generation, sections_limit=3, questions_limit=5):
+    with read_connection() as conn:
+        summary = read_record("SELECT * FROM summary", conn, Summary)
+        summary.recent_sections = _recent_sections(conn, sections_limit)
+        summary.recent_questions = _recent_questions(conn, questions_limit)
+        return summary
+
+# ===== Изменения =====
+# Публичные функции ставят операцию в очередь записи и возвращают Future
+
+def _add_section(conn, title, description):
+    conn.execute("INSERT INTO sections (title, description) VALUES (?, ?)",
+                 (title, description))
+
+def _add_question(conn, section_id, question, answer, info):
+    cursor = conn.execute("INSERT INTO questions (section_id, question, answer, info) VALUES (?, ?, ?, ?)",
+                          (section_id, question, answer, info))
+    return cursor.lastrowid
+
+def _update_question(conn, question_id, question, answer, info):
+    conn.execute("UPDATE questions SET question = ?, answer = ?, info = ? WHERE id = ?",
+                 (question, answer, info, question_id))
+
+def _update_section(conn, section_id, title, description):
+    conn.execute("UPDATE sections SET title = ?, description = ? WHERE id = ?",
+                 (title, description, section_id))
+
+def _delete_section(conn, section_id):
+    # Вопросы раздела удаляет ON DELETE CASCADE
+    conn.execute("DELETE FROM sections WHERE id = ?", (section_id,))
+
+def _delete_question(conn, question_id):
+    conn.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+
+def add_section(title, description):
+    return get_write_queue().submit(_add_section, title, description)
+
+def add_question(section_id, question, answer, info):
+    return get_write_queue().submit(_add_question, section_id, question, answer, info)
+
+def update_question(question_id, question, answer, info):
+    return get_write_queue().submit(_update_question, question_id, question, answer, info)
+
+def update_section(section_id, title, description):
+    return get_write_queue().submit(_update_section, section_id, title, description)
+
+def delete_section(section_id):
+    return get_write_queue().submit(_delete_section, section_id)
+
+def delete_question(question_id):
+    return get_write_queue().submit(_delete_question, question_id)
@@ -0,0 +1,314 @@
+import os
+import zlib
+from collections import defaultdict
+
+import numpy as np
+import streamlit as st
+
+from db import DB_FILE
+from question_index import IndexKeeper, QuestionIndex, timed
+from semantic import tokenize
+
+# Поиск почти одинаковых вопросов: MinHash-подписи текста вопроса и
+# LSH-корзины по полосам подписи. Кандидаты берутся только из корзин,
+# где совпала хотя бы одна полоса, поэтому проверка одного текста не
+# просматривает всю базу.
+
+# Файл индекса лежит рядом с базой
+INDEX_FILE = os.path.splitext(DB_FILE)[0] + ".minhash.npz"
+
+# Подпись из NUM_HASHES значений режется на BANDS полос по ROWS_PER_BAND:
+# 16 полос по 4 значения делают кандидатами пары с похожестью примерно от 0.5
+NUM_HASHES = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_HASHES // BANDS
+
+# Доля совпавших значений подписи (оценка коэффициента Жаккара),
+# начиная с которой вопросы считаются дубликатами
+MIN_SIMILARITY = 0.6
+
+# Сколько похожих вопросов показывать при вводе
+DUPLICATES_SHOWN = 5
+
+# Большие корзины в отчёте сравниваем не попарно, а с первым вопросом
+MAX_PAIRWISE_BUCKET = 64
+
+# Подписи считаются, а пары в отчёте сравниваются пачками такого размера
+SIGNATURE_BATCH = 10000
+PAIR_BATCH = 100000
+
+# Новые строки копятся отдельно и вливаются в корзины пачкой
+MERGE_THRESHOLD = 10000
+
+# Хэш-функции (a * x + b) mod p по простому 2^31 - 1: для 32-битных x
+# произведение помещается в uint64. Зерно фиксировано — подписи из файла
+# индекса должны совпадать с подписями новых текстов.
+PRIME = (1 << 31) - 1
+HASH_SEED = 1
+_hash_random = np.random.RandomState(HASH_SEED)
+HASH_A = _hash_random.randint(1, PRIME, size=NUM_HASHES).astype(np.uint64)
+HASH_B = _hash_random.randint(0, PRIME, size=NUM_HASHES).astype(np.uint64)
+
+# Параметры, с которыми построен сохранённый индекс
+PARAMS = (NUM_HASHES, BANDS, HASH_SEED)
+
+# ===== Подписи =====
+# Шинглы — слова и пары соседних слов после нормализации (нижний регистр,
+# без стоп-слов, с отрезанными окончаниями). Слова поодиночке нужны коротким
+# вопросам: по одним парам вставка слова меняет слишком большую долю шинглов.
+def shingles(text):
+    hashes = [zlib.crc32(word.encode()) for word in tokenize(text)]
+    values = set(hashes)
+    values.update((first * 0x9E3779B1 + second) & 0xFFFFFFFF for first, second in zip(hashes, hashes[1:]))
+    return np.fromiter(values, dtype=np.uint64, count=len(values))
+
+# Подписи для списка непустых наборов шинглов: минимум каждой хэш-функции
+# по шинглам документа (np.minimum.reduceat по границам документов)
+def minhash(shingle_sets):
+    starts = np.cumsum([0] + [len(values) for values in shingle_sets[:-1]])
+    values = np.concatenate(shingle_sets)
+    signatures = np.empty((len(shingle_sets), NUM_HASHES), dtype=np.uint32)
+    for column in range(NUM_HASHES):
+        hashed = (HASH_A[column] * values + HASH_B[column]) % np.uint64(PRIME)
+        signatures[:, column] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+# Ключ корзины для каждой полосы подписи: (n, NUM_HASHES) -> (n, BANDS)
+def band_keys(signatures):
+    bands = signatures.reshape(len(signatures), BANDS, ROWS_PER_BAND).astype(np.uint64)
+    keys = np.zeros(bands.shape[:2], dtype=np.uint64)
+    for column in range(ROWS_PER_BAND):
+        keys = keys * np.uint64(0x100000001B3) ^ bands[:, :, column]
+    return keys
+
+# ===== Индекс =====
+# Для каждой полосы ключи корзин всех строк лежат отсортированными
+# (band_keys) вместе с номерами строк (band_rows): корзина — это отрезок,
+# который находится двоичным поиском.
+class DuplicateIndex(QuestionIndex):
+    merge_threshold = MERGE_THRESHOLD
+
+    def _reset(self):
+        super()._reset()
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.signatures = np.zeros((0, NUM_HASHES), dtype=np.uint32)
+        self.band_keys = np.zeros((BANDS, 0), dtype=np.uint64)
+        self.band_rows = np.zeros((BANDS, 0), dtype=np.int32)
+        self.pending_signatures = []
+        self.pending_buckets = defaultdict(list)  # (полоса, ключ) -> новые строки
+
+    @staticmethod
+    def _fields(question, answer, info):
+        return (question,)
+
+    @property
+    def pending_size(self):
+        return len(self.pending_signatures)
+
+    # ----- Построение и сохранение -----
+    def build(self, documents):
+        with self._lock:
+            self._reset()
+            doc_ids, signatures = [], []
+            batch_ids, batch = [], []
+            for question_id, question in documents:
+                values = shingles(question)
+                # Вопрос без значимых слов сравнивать не с чем
+                if not len(values):
+                    continue
+                batch_ids.append(question_id)
+                batch.append(values)
+                if len(batch) == SIGNATURE_BATCH:
+                    doc_ids.extend(batch_ids)
+                    signatures.append(minhash(batch))
+                    batch_ids, batch = [], []
+            if batch:
+                doc_ids.extend(batch_ids)
+                signatures.append(minhash(batch))
+
+            self.doc_ids = np.asarray(doc_ids, dtype=np.int64)
+            self.alive = np.ones(len(doc_ids), dtype=bool)
+            self.row_of = {question_id: row for row, question_id in enumerate(doc_ids)}
+            if signatures:
+                self.signatures = np.concatenate(signatures)
+            self._set_buckets()
+            self.dirty = True
+
+    def _set_buckets(self):
+        keys = band_keys(self.signatures).T
+        order = np.argsort(keys, axis=1, kind="stable")
+        self.band_keys = np.take_along_axis(keys, order, axis=1)
+        self.band_rows = order.astype(np.int32)
+
+    # Вливаем новые строки в основные массивы
+    def merge(self):
+        with self._lock:
+            if not self.pending_signatures:
+                return
+            self.signatures = np.concatenate([self.signatures, np.asarray(self.pending_signatures)])
+            self.pending_signatures = []
+            self.pending_buckets.clear()
+            self._set_buckets()
+
+    def save(self, path):
+        with self._lock:
+            self.merge()
+            # Пишем во временный файл и подменяем: файл читают и пишут другие процессы
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                np.savez(
+                    f,
+                    params=np.asarray(PARAMS, dtype=np.int64),
+                    doc_ids=self.doc_ids,
+                    alive=self.alive,
+                    signatures=self.signatures,
+                    band_keys=self.band_keys,
+                    band_rows=self.band_rows,
+                    version=np.asarray(self.version, dtype=np.int64),
+                )
+            os.replace(temp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with np.load(path) as data:
+            if tuple(data["params"].tolist()) != PARAMS:
+                raise ValueError("Индекс построен с другими параметрами")
+            index.doc_ids = data["doc_ids"]
+            index.alive = data["alive"]
+            index.signatures = data["signatures"]
+            index.band_keys = data["band_keys"]
+            index.band_rows = data["band_rows"]
+            index.version = int(data["version"])
+        index.row_of = {int(question_id): row
+                        for row, question_id in enumerate(index.doc_ids.tolist()) if index.alive[row]}
+        return index
+
+    # ----- Инкрементальные изменения -----
+    def add(self, question_id, question):
+        with self._lock:
+            self.remove(question_id)
+            values = shingles(question)
+            if not len(values):
+                return
+            signature = minhash([values])[0]
+            row = len(self.doc_ids)
+            self.doc_ids = np.append(self.doc_ids, question_id)
+            self.alive = np.append(self.alive, True)
+            self.row_of[question_id] = row
+            self.pending_signatures.append(signature)
+            for band, key in enumerate(band_keys(signature[None, :])[0].tolist()):
+                self.pending_buckets[band, key].append(row)
+            self.dirty = True
+
+    # ----- Поиск -----
+    # Подписи строк: из основного массива или из ещё не влитых
+    def _signature_rows(self, rows):
+        main = len(self.signatures)
+        signatures = np.empty((len(rows), NUM_HASHES), dtype=np.uint32)
+        in_main = rows < main
+        signatures[in_main] = self.signatures[rows[in_main]]
+        for position in np.flatnonzero(~in_main).tolist():
+            signatures[position] = self.pending_signatures[rows[position] - main]
+        return signatures
+
+    # Похожие на текст вопросы: [(question_id, похожесть)] по убыванию
+    def query(self, text, exclude_id=None, limit=DUPLICATES_SHOWN, min_similarity=MIN_SIMILARITY):
+        values = shingles(text)
+        if not len(values):
+            return []
+        signature = minhash([values])[0]
+        keys = band_keys(signature[None, :])[0]
+        with self._lock:
+            found = []
+            for band, key in enumerate(keys.tolist()):
+                band_keys_sorted = self.band_keys[band]
+                start = np.searchsorted(band_keys_sorted, key, side="left")
+                end = np.searchsorted(band_keys_sorted, key, side="right")
+                found.append(self.band_rows[band, start:end])
+                found.append(np.asarray(self.pending_buckets.get((band, key), ()), dtype=np.int32))
+            rows = np.unique(np.concatenate(found))
+            rows = rows[self.alive[rows]]
+            if exclude_id is not None:
+                rows = rows[self.doc_ids[rows] != exclude_id]
+            if not len(rows):
+                return []
+            similarity = (self._signature_rows(rows) == signature).mean(axis=1)
+            keep = similarity >= min_similarity
+            rows, similarity = rows[keep], similarity[keep]
+            top = np.argsort(-similarity, kind="stable")[:limit]
+            return [(int(self.doc_ids[rows[i]]), float(similarity[i])) for i in top]
+
+    # Пары строк, попавших в одну корзину хотя бы в одной полосе. Корзины
+    # одного размера обрабатываются разом; большие — только парами с первым.
+    def _bucket_pairs(self):
+        firsts, seconds = [], []
+        for band in range(BANDS):
+            keys, rows = self.band_keys[band], self.band_rows[band]
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+            sizes = np.diff(np.concatenate((starts, [len(keys)])))
+            for size in np.unique(sizes[sizes > 1]).tolist():
+                if size <= MAX_PAIRWISE_BUCKET:
+                    left, right = np.triu_indices(size, k=1)
+                else:
+                    left, right = np.zeros(size - 1, dtype=np.int64), np.arange(1, size)
+                bucket_starts = starts[sizes == size][:, None]
+                firsts.append(rows[(bucket_starts + left).ravel()])
+                seconds.append(rows[(bucket_starts + right).ravel()])
+        if not firsts:
+            return np.zeros((2, 0), dtype=np.int64)
+        pairs = np.sort(np.stack((np.concatenate(firsts), np.concatenate(seconds))).astype(np.int64), axis=0)
+        pairs = pairs[:, self.alive[pairs[0]] & self.alive[pairs[1]]]
+        # Одна и та же пара встречается в нескольких полосах
+        codes = np.unique(pairs[0] * len(self.doc_ids) + pairs[1])
+        return np.stack((codes // len(self.doc_ids), codes % len(self.doc_ids)))
+
+    # Группы дубликатов по всей базе за один проход по корзинам: похожие
+    # пары склеиваются (система непересекающихся множеств).
+    # Возвращает списки question_id, крупные группы первыми.
+    def clusters(self, min_similarity=MIN_SIMILARITY):
+        with self._lock:
+            self.merge()
+            pairs = self._bucket_pairs()
+            similar = []
+            for start in range(0, pairs.shape[1], PAIR_BATCH):
+                chunk = pairs[:, start:start + PAIR_BATCH]
+                similarity = (self.signatures[chunk[0]] == self.signatures[chunk[1]]).mean(axis=1)
+                similar.append(chunk[:, similarity >= min_similarity])
+
+            parent = {}
+
+            def find(row):
+                parent.setdefault(row, row)
+                while parent[row] != row:
+                    parent[row] = parent[parent[row]]
+                    row = parent[row]
+                return row
+
+            for first, second in np.concatenate(similar, axis=1).T.tolist() if similar else ():
+                first, second = find(first), find(second)
+                if first != second:
+                    parent[max(first, second)] = min(first, second)
+
+            groups = defaultdict(list)
+            for row in parent:
+                groups[find(row)].append(int(self.doc_ids[row]))
+            clusters = [sorted(ids) for ids in groups.values()]
+            return sorted(clusters, key=lambda ids: (-len(ids), ids[0]))
+
+# ===== Индекс процесса =====
+_keeper = IndexKeeper(DuplicateIndex, "SELECT id, question FROM questions ORDER BY id", INDEX_FILE)
+
+@st.cache_resource(show_spinner="Готовим поиск дубликатов...")
+def get_duplicate_index():
+    return _keeper.open()
+
+# Уже существующие вопросы, почти совпадающие с текстом: [(question_id, похожесть)].
+# exclude_id — сам редактируемый вопрос.
+def find_duplicates(text, exclude_id=None, limit=DUPLICATES_SHOWN):
+    return timed("find_duplicates", lambda: _keeper.ready(get_duplicate_index()).query(text, exclude_id, limit))
+
+def duplicate_clusters(min_similarity=MIN_SIMILARITY):
+    return timed("duplicate_clusters", lambda: _keeper.ready(get_duplicate_index()).clusters(min_similarity))
@@ -0,0 +1,298 @@
+# Нагрузочный тест: много одновременных сессий Streamlit без браузера и сети
+# (streamlit.testing.v1.AppTest) на синтетической базе знаний из benchmark.py.
+#
+#   python loadtest.py --sessions 20 --duration 60 --questions 50000
+#   python loadtest.py --sessions 50 --processes 4 --admins 0.1 --db /tmp/kb.db --reuse
+#   python loadtest.py --sessions 20 --backup-every 10   # цена резервного копирования
+#
+# AppTest на время каждого перезапуска подменяет общий для процесса Runtime,
+# поэтому сессии одного процесса ходят по очереди, а параллельно работают
+# процессы (--processes). Сессии одного процесса делят кэши и пул соединений,
+# как в одном сервере Streamlit; процессы — как несколько серверов на одной базе.
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from benchmark import QUIET_LOGGERS, WORDS, generate_knowledge_base, summarize
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Таймаут одного перезапуска скрипта, с
+RERUN_TIMEOUT = 120
+
+# Признаки ошибок блокировки SQLite в исключениях и сообщениях приложения
+LOCK_ERRORS = ("database is locked", "database table is locked", "busy")
+
+def _is_lock_error(text):
+    text = text.lower()
+    return any(marker in text for marker in LOCK_ERRORS)
+
+# ===== Одна сессия =====
+class Session:
+    def __init__(self, rng, stats, admin=False):
+        self.rng = rng
+        self.stats = stats
+        self.admin = admin
+        self.open()
+
+    # Новая вкладка браузера: пустое состояние сессии
+    def open(self):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_FILE, default_timeout=RERUN_TIMEOUT)
+        self.rerun("open", self.at.run)
+        if self.admin:
+            self.login()
+
+    # Один перезапуск: замер времени и разбор ошибок на странице
+    def rerun(self, action, run):
+        started = time.perf_counter()
+        try:
+            run()
+        except Exception as error:
+            # Сбой самого AppTest (например, устаревший виджет в дереве) —
+            # сессия дальше непригодна, открываем её заново
+            self.stats.record(action, (time.perf_counter() - started) * 1000, [f"AppTest: {error!r}"])
+            self.open()
+            return False
+        errors = [exception.message for exception in self.at.exception]
+        errors += [f"st.error: {element.value}" for element in self.at.error]
+        self.stats.record(action, (time.perf_counter() - started) * 1000, errors)
+        return not errors
+
+    def _buttons(self, prefix):
+        return [button for button in self.at.button if (button.key or "").startswith(prefix)]
+
+    def _button(self, label):
+        return next((button for button in self.at.button if button.label == label), None)
+
+    def _click(self, action, button):
+        return button is not None and self.rerun(action, button.click().run)
+
+    # ----- Сценарии -----
+    def browse(self):
+        if not self._click("navigate", self.rng.choice(self._buttons("nav_") or [None])):
+            return
+        questions = self._buttons("open_section_")
+        if questions:
+            self._click("expand", self.rng.choice(questions))
+        if self.rng.random() < 0.3:
+            next_page = next(iter(self._buttons("page_next")), None)
+            if next_page is not None and not next_page.disabled:
+                self._click("next_page", next_page)
+
+    def search(self):
+        query = " ".join(self.rng.sample(WORDS, self.rng.randint(1, 3)))
+        if not self.rerun("search", self.at.text_input(key="search_input").input(query).run):
+            return
+        results = self._buttons("open_search_")
+        if results:
+            self._click("expand", self.rng.choice(results[:10]))
+        if self.rng.random() < 0.3:
+            next_page = next(iter(self._buttons("search_next")), None)
+            if next_page is not None and not next_page.disabled:
+                self._click("search_page", next_page)
+        if self.rng.random() < 0.3:
+            self.rerun("similar", self.at.radio(key="search_kind").set_value("Похожие вопросы").run)
+        self._click("search_back", self._button("← Назад"))
+
+    def login(self):
+        password = next(field for field in self.at.text_input if field.label == "Пароль админа")
+        password.input("admin123")
+        self._click("login", self._button("Войти как админ"))
+
+    def edit(self):
+        if not self._click("navigate", self.rng.choice(self._buttons("nav_") or [None])):
+            return
+        if self.rng.random() < 0.5:
+            text = " ".join(self.rng.sample(WORDS, 8)).capitalize() + "?"
+            fields = {field.label: field for field in self.at.text_area}
+            fields["Вопрос / Ситуация"].input(text)
+            fields["Ответ / Порядок действий"].input(" ".join(self.rng.sample(WORDS, 20)))
+            self._click("add_question", self._button("Добавить"))
+            return
+        questions = self._buttons("open_section_")
+        if not questions or not self._click("expand", self.rng.choice(questions)):
+            return
+        if not self._click("edit_open", next(iter(self._buttons("edit_")), None)):
+            return
+        fields = {field.label: field for field in self.at.text_area}
+        if "Ответ" in fields:
+            fields["Ответ"].input(fields["Ответ"].value + " (обновлено)")
+            self._click("edit_save", self._button("💾 Сохранить"))
+
+    def step(self):
+        if self.admin and self.rng.random() < 0.5:
+            self.edit()
+        elif self.rng.random() < 0.5:
+            self.browse()
+        else:
+            self.search()
+
+# ===== Сбор статистики =====
+class LoadStats:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock_errors = 0
+
+    def record(self, action, ms, errors):
+        self.latency[action].append(ms)
+        for error in errors:
+            self.errors[error.splitlines()[0][:200]] += 1
+            if _is_lock_error(error):
+                self.lock_errors += 1
+
+    def merge(self, other):
+        for action, samples in other.latency.items():
+            self.latency[action].extend(samples)
+        for error, count in other.errors.items():
+            self.errors[error] += count
+        self.lock_errors += other.lock_errors
+
+    def reruns(self):
+        return sum(len(samples) for samples in self.latency.values())
+
+# ===== Процесс с группой сессий =====
+def run_worker(session_ids, admins, args, barrier, results):
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).disabled = True
+
+    # Открытие сессий и вход админов не входят в замер
+    warmup = LoadStats()
+    sessions = [Session(random.Random(args.seed + index), warmup, admin=index < admins)
+                for index in session_ids]
+    import duplicates
+    import semantic
+    semantic.get_semantic_index()
+    duplicates.get_duplicate_index()
+
+    stats = LoadStats()
+    for session in sessions:
+        session.stats = stats
+    barrier.wait()
+    deadline = time.monotonic() + args.duration
+    rounds = 0
+    while time.monotonic() < deadline and (not args.steps or rounds < args.steps):
+        for session in sessions:
+            session.step()
+        rounds += 1
+    results.put(stats)
+
+# Резервные копии во время теста (--backup-every): копия снимается в основном
+# процессе, как в фоновом потоке приложения, а сессии измеряют, во что это обходится
+def run_backups(interval, stop, backups):
+    import backup
+    while not stop.wait(interval):
+        result = backup.create_backup()
+        backups.append({"seconds": result.seconds, "steps": result.steps, "max_step_ms": result.max_step_ms,
+                        "db_size_mb": result.db_size / 2 ** 20, "size_mb": result.size / 2 ** 20})
+
+def print_report(report):
+    print(f"Сессий: {report['sessions']} (админов: {report['admins']}, процессов: {report['processes']}), "
+          f"перезапусков: {report['reruns']} за {report['elapsed_seconds']:.1f} с "
+          f"→ {report['reruns_per_second']:.1f} в секунду")
+    print(f"{'действие':<14}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'макс, мс':>10}")
+    for action, result in report["actions"].items():
+        print(f"{action:<14}{result['runs']:>8}{result['p50_ms']:>10.0f}{result['p95_ms']:>10.0f}"
+              f"{result['p99_ms']:>10.0f}{result['max_ms']:>10.0f}")
+    for number, result in enumerate(report["backups"], 1):
+        print(f"Копия {number}: {result['db_size_mb']:.0f} МБ → {result['size_mb']:.0f} МБ за {result['seconds']:.1f} с, "
+              f"шагов {result['steps']}, самый долгий {result['max_step_ms']:.0f} мс")
+    print(f"Ошибок: {sum(report['errors'].values())}, из них блокировок SQLite: {report['lock_errors']}")
+    for error, count in sorted(report["errors"].items(), key=lambda item: -item[1])[:10]:
+        print(f"  {count:>5} × {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест app.py на синтетической базе знаний")
+    parser.add_argument("--sessions", type=int, default=10, help="одновременных сессий")
+    parser.add_argument("--processes", type=int, default=min(os.cpu_count() or 1, 4),
+                        help="процессов, между которыми делятся сессии")
+    parser.add_argument("--admins", type=float, default=0.1, help="доля сессий администратора")
+    parser.add_argument("--duration", type=float, default=30, help="длительность теста, с")
+    parser.add_argument("--steps", type=int, default=0, help="сценариев на сессию (0 — без ограничения)")
+    parser.add_argument("--sections", type=int, default=100)
+    parser.add_argument("--questions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="файл синтетической базы (по умолчанию временный)")
+    parser.add_argument("--reuse", action="store_true", help="не пересоздавать базу, если файл уже есть")
+    parser.add_argument("--backup-every", type=float, default=0,
+                        help="снимать резервную копию каждые N секунд теста (0 — без копий)")
+    parser.add_argument("--output", default="loadtest_report.json")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="kb-load-"), "knowledge.db")
+    if os.path.exists(path) and not args.reuse:
+        os.remove(path)
+    # Модули базы читают путь при импорте
+    os.environ["KNOWLEDGE_DB"] = path
+    # Копии по расписанию в сессиях отключены: их снимает только сам тест (--backup-every)
+    os.environ["KNOWLEDGE_BACKUP_DIR"] = os.path.join(os.path.dirname(path), "loadtest-backups")
+    os.environ["KNOWLEDGE_BACKUP_INTERVAL"] = "0"
+
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).disabled = True
+
+    if not (args.reuse and os.path.exists(path)):
+        print(f"Генерируем базу: {args.sections} разделов, {args.questions} вопросов → {path}")
+        generate_knowledge_base(path, args.sections, args.questions, args.seed)
+
+    admins = round(args.sessions * args.admins)
+    processes = max(1, min(args.processes, args.sessions))
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(processes + 1)
+    results = context.Queue()
+    workers = [context.Process(target=run_worker,
+                               args=(list(range(worker, args.sessions, processes)), admins, args, barrier, results))
+               for worker in range(processes)]
+    for worker in workers:
+        worker.start()
+    print(f"Запускаем {args.sessions} сессий в {processes} процессах...")
+    barrier.wait()
+    started = time.monotonic()
+    backups, stop_backups = [], threading.Event()
+    if args.backup_every:
+        backup_thread = threading.Thread(target=run_backups, args=(args.backup_every, stop_backups, backups))
+        backup_thread.start()
+
+    stats = LoadStats()
+    for _ in workers:
+        stats.merge(results.get())
+    elapsed = time.monotonic() - started
+    if args.backup_every:
+        stop_backups.set()
+        backup_thread.join()
+    for worker in workers:
+        worker.join()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sessions": args.sessions,
+        "admins": admins,
+        "processes": processes,
+        "elapsed_seconds": elapsed,
+        "reruns": stats.reruns(),
+        "reruns_per_second": stats.reruns() / elapsed,
+        "config": {"sections": args.sections, "questions": args.questions, "seed": args.seed,
+                   "backup_every": args.backup_every, "sqlite": sqlite3.sqlite_version},
+        "actions": {action: summarize(samples) for action, samples in sorted(stats.latency.items())},
+        "all": summarize([ms for samples in stats.latency.values() for ms in samples]) if stats.reruns() else {},
+        "errors": dict(stats.errors),
+        "lock_errors": stats.lock_errors,
+        "backups": backups,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_report(report)
+    print(f"Отчёт: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import heapq
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+
+import streamlit as st
+
+# Метрики производительности: время SQL-запросов, сборки результата,
+# попадания в кэш читающих функций и полное время перезапуска скрипта.
+# Хранилище одно на процесс и общее для всех сессий.
+
+# Границы корзин гистограммы, мс
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Сколько самых медленных запросов помнить
+SLOWEST_KEPT = 20
+
+# Файл для сборщика Prometheus (если задан) и как часто его перезаписывать, с
+METRICS_FILE = os.environ.get("KNOWLEDGE_METRICS_FILE")
+METRICS_FILE_INTERVAL = 15
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        position = 0
+        while position < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[position]:
+            position += 1
+        self.buckets[position] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    # Оценка перцентиля по верхней границе корзины
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        threshold = self.count * q / 100
+        cumulative = 0
+        for position, count in enumerate(self.buckets):
+            cumulative += count
+            if cumulative >= threshold:
+                return LATENCY_BUCKETS_MS[position] if position < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def labels(self):
+        return [f"≤{bound} мс" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]} мс"]
+
+class QueryStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+
+class HelperStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.hits = 0
+        self.misses = 0
+
+def normalize_query(sql):
+    return re.sub(r"\s+", " ", sql).strip()
+
+class MetricsStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.queries = {}
+            self.helpers = {}
+            self.reruns = Histogram()
+            self.phase_ms = {"sql": 0.0, "build": 0.0, "render": 0.0}
+            self.slowest = []
+            self._file_written_at = 0.0
+
+    # ----- Запись -----
+    def record_query(self, sql, rows, sql_ms, build_ms=0.0):
+        sql = normalize_query(sql)
+        with self._lock:
+            stats = self.queries.setdefault(sql, QueryStats())
+            stats.latency.observe(sql_ms + build_ms)
+            stats.rows += rows
+            entry = (sql_ms + build_ms, time.time(), sql, rows)
+            if len(self.slowest) < SLOWEST_KEPT:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+        rerun = getattr(self._local, "rerun", None)
+        if rerun is not None:
+            rerun["sql"] += sql_ms
+            rerun["build"] += build_ms
+
+    def record_call(self, helper, ms, hit):
+        with self._lock:
+            stats = self.helpers.setdefault(helper, HelperStats())
+            stats.latency.observe(ms)
+            if hit:
+                stats.hits += 1
+            else:
+                stats.misses += 1
+        rerun = getattr(self._local, "rerun", None)
+        if rerun is not None:
+            rerun["helpers"] += ms
+
+    # Перезапуск скрипта: start_rerun() в начале app.py, finish_rerun() в конце
+    def start_rerun(self):
+        self._local.rerun = {"started": time.perf_counter(), "sql": 0.0, "build": 0.0, "helpers": 0.0}
+
+    def finish_rerun(self):
+        rerun = getattr(self._local, "rerun", None)
+        if rerun is None:
+            return
+        self._local.rerun = None
+        total_ms = (time.perf_counter() - rerun["started"]) * 1000
+        with self._lock:
+            self.reruns.observe(total_ms)
+            self.phase_ms["sql"] += rerun["sql"]
+            self.phase_ms["build"] += rerun["build"]
+            self.phase_ms["render"] += max(total_ms - rerun["helpers"], 0.0)
+        if METRICS_FILE and time.time() - self._file_written_at > METRICS_FILE_INTERVAL:
+            # finish_rerun() вызывается из finally: ошибка записи файла
+            # не должна подменить собой st.rerun() или ошибку страницы
+            try:
+                self.write_prometheus(METRICS_FILE)
+            except OSError:
+                traceback.print_exc()
+
+    # ----- Чтение -----
+    def query_rows(self):
+        with self._lock:
+            return [
+                {
+                    "Запрос": sql,
+                    "Вызовов": stats.latency.count,
+                    "Строк": stats.rows,
+                    "Среднее, мс": round(stats.latency.mean_ms, 2),
+                    "p95, мс": stats.latency.percentile(95),
+                    "Макс., мс": round(stats.latency.max_ms, 2),
+                }
+                for sql, stats in sorted(self.queries.items(), key=lambda item: -item[1].latency.total_ms)
+            ]
+
+    def helper_rows(self):
+        with self._lock:
+            return [
+                {
+                    "Функция": name,
+                    "Вызовов": stats.latency.count,
+                    "Из кэша": stats.hits,
+                    "Промахов": stats.misses,
+                    "Среднее, мс": round(stats.latency.mean_ms, 3),
+                    "p95, мс": stats.latency.percentile(95),
+                }
+                for name, stats in sorted(self.helpers.items())
+            ]
+
+    def slowest_rows(self):
+        with self._lock:
+            return [
+                {
+                    "Время, мс": round(ms, 2),
+                    "Когда": time.strftime("%H:%M:%S", time.localtime(at)),
+                    "Строк": rows,
+                    "Запрос": sql,
+                }
+                for ms, at, sql, rows in sorted(self.slowest, reverse=True)
+            ]
+
+    def histogram(self, sql=None):
+        with self._lock:
+            histogram = self.reruns if sql is None else self.queries[sql].latency
+            return dict(zip(histogram.labels(), histogram.buckets))
+
+    def cache_hit_ratio(self):
+        with self._lock:
+            hits = sum(stats.hits for stats in self.helpers.values())
+            total = sum(stats.latency.count for stats in self.helpers.values())
+        return hits / total if total else 0.0
+
+    # ----- Экспорт в текстовом формате Prometheus -----
+    def to_prometheus(self):
+        lines = []
+
+        def label(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+        def histogram(name, help_text, items):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in items:
+                prefix = f"{labels}," if labels else ""
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS_MS, hist.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound / 1000}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {hist.count}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {hist.total_ms / 1000}")
+                lines.append(f"{name}_count{suffix} {hist.count}")
+
+        with self._lock:
+            histogram("kb_query_duration_seconds", "Время SQL-запроса вместе с преобразованием результата",
+                      [(f'query="{label(sql)}"', stats.latency) for sql, stats in self.queries.items()])
+            lines.append("# HELP kb_query_rows_total Строк возвращено запросом")
+            lines.append("# TYPE kb_query_rows_total counter")
+            for sql, stats in self.queries.items():
+                lines.append(f'kb_query_rows_total{{query="{label(sql)}"}} {stats.rows}')
+
+            histogram("kb_helper_duration_seconds", "Время вызова читающей функции",
+                      [(f'helper="{name}"', stats.latency) for name, stats in self.helpers.items()])
+            lines.append("# HELP kb_helper_cache_total Обращения к кэшу читающих функций")
+            lines.append("# TYPE kb_helper_cache_total counter")
+            for name, stats in self.helpers.items():
+                lines.append(f'kb_helper_cache_total{{helper="{name}",result="hit"}} {stats.hits}')
+                lines.append(f'kb_helper_cache_total{{helper="{name}",result="miss"}} {stats.misses}')
+
+            histogram("kb_rerun_duration_seconds", "Полное время перезапуска скрипта", [("", self.reruns)])
+            lines.append("# HELP kb_rerun_phase_seconds_total Время перезапусков по этапам")
+            lines.append("# TYPE kb_rerun_phase_seconds_total counter")
+            for phase, ms in self.phase_ms.items():
+                lines.append(f'kb_rerun_phase_seconds_total{{phase="{phase}"}} {ms / 1000}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Пишем во временный файл и подменяем, чтобы сборщик не прочитал половину.
+        # Имя временного файла своё у каждого вызова: сессии пишут одновременно
+        fd, temp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.",
+                                         dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._file_written_at = time.time()
+
+@st.cache_resource
+def get_metrics():
+    return MetricsStore()
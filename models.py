@@ -0,0 +1,55 @@
+# Лёгкие записи для результатов запросов вместо строк DataFrame.
+# __slots__ экономит память и время на создание объекта, а записи
+# нормально сериализуются для st.cache_data.
+
+class Record:
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    # Сборка из строки курсора; поля, которых нет в запросе, остаются None
+    @classmethod
+    def from_rows(cls, columns, rows):
+        records = []
+        for row in rows:
+            record = cls.__new__(cls)
+            for name in cls.__slots__:
+                setattr(record, name, None)
+            for name, value in zip(columns, row):
+                setattr(record, name, value)
+            records.append(record)
+        return records
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class Section(Record):
+    __slots__ = ("id", "title", "description", "created_at", "question_count")
+
+# Строка списка вопросов: только заголовок, без полного текста
+class QuestionTitle(Record):
+    __slots__ = ("id", "section_id", "title", "section_title", "created_at", "snippet")
+
+class Question(Record):
+    __slots__ = ("id", "section_id", "question", "answer", "info", "created_at", "section_title")
+
+# Сводка для главной страницы (таблица summary и последние записи)
+class Summary(Record):
+    __slots__ = ("id", "sections", "questions", "updated_at", "recent_sections", "recent_questions")
+
+# Страница результатов поиска: total — совпадений во всех разделах,
+# found — в выбранном разделе, facets — разделы (Section) с числом совпадений
+class SearchPage(Record):
+    __slots__ = ("total", "found", "facets", "results")
+
+# Резервная копия базы (backup.py). Для списка копий заполнены name, created_at
+# и size; после создания — ещё размер базы, время и шаги копирования
+class Backup(Record):
+    __slots__ = ("name", "created_at", "size", "db_size", "seconds", "steps", "max_step_ms")
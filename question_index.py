@@ -0,0 +1,146 @@
+import atexit
+import os
+import threading
+import time
+
+from db import data_generation, question_changes_since, read_transaction
+from metrics import get_metrics
+
+# Общее для индексов вопросов в памяти (похожие вопросы, дубликаты,
+# подсказки): инкрементальные изменения по журналу question_changes
+# и поддержание индекса процесса в актуальном состоянии.
+
+# Удалённые и изменённые строки остаются в индексе мёртвыми; когда их
+# накапливается заметная доля, индекс перестраивается заново
+REBUILD_RATIO = 0.2
+REBUILD_MIN = 1000
+
+# Основа индекса: строки документов, живые и удалённые, поколение данных.
+# Наследник хранит свои структуры (doc_ids, alive и т.д.), задаёт build(rows)
+# и add(question_id, *fields), а _fields переводит вопрос из журнала
+# изменений в аргументы add — в той же форме, что строки для build.
+class QuestionIndex:
+    # Сколько новых строк копить до записи в файл (если индекс сохраняется)
+    merge_threshold = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.row_of = {}
+        self.stale_rows = 0
+        self.needs_rebuild = False
+        # Поколение данных (data_version), по которое внесены изменения,
+        # и есть ли изменения, не записанные в файл
+        self.version = 0
+        self.dirty = False
+
+    @property
+    def size(self):
+        return len(self.row_of)
+
+    @staticmethod
+    def _fields(question, answer, info):
+        return question, answer, info
+
+    def remove(self, question_id):
+        with self._lock:
+            row = self.row_of.pop(question_id, None)
+            if row is not None:
+                self.alive[row] = False
+                self.stale_rows += 1
+                self.dirty = True
+
+    # changes — из question_changes_since; None — изменилось слишком много
+    def apply(self, changes):
+        with self._lock:
+            if changes is None:
+                self.needs_rebuild = True
+                return
+            for question_id, fields in changes:
+                if fields is None:
+                    self.remove(question_id)
+                else:
+                    self.add(question_id, *self._fields(*fields))
+            if self.stale_rows > max(REBUILD_MIN, REBUILD_RATIO * self.size):
+                self.needs_rebuild = True
+
+# ===== Индекс процесса =====
+# Индекс помнит поколение данных, по которое он построен, и перед запросом
+# догоняет базу по журналу изменений. Запись его не касается: ни построение,
+# ни блокировка индекса её не задерживают. Если задан файл, индекс
+# загружается из него и догоняет базу только с сохранённого поколения,
+# а изменения, накопленные в памяти, записываются при выходе из процесса.
+# on_change() вызывается, когда индекс изменился (например, сбросить кэш).
+class IndexKeeper:
+    def __init__(self, index_class, rows_query, path=None, on_change=None):
+        self.index_class = index_class
+        self.rows_query = rows_query
+        self.path = path
+        self.on_change = on_change
+
+    def _rows(self, conn):
+        cursor = conn.execute(self.rows_query)
+        while batch := cursor.fetchmany(1000):
+            yield from batch
+
+    def _rebuild(self, index):
+        with read_transaction() as conn:
+            version = conn.execute("SELECT version FROM data_version").fetchone()[0]
+            index.build(self._rows(conn))
+        index.version = version
+        if self.path:
+            index.save(self.path)
+
+    def _catch_up(self, index):
+        with index._lock:
+            with read_transaction() as conn:
+                version, changes = question_changes_since(conn, index.version)
+            index.apply(changes)
+            if index.needs_rebuild:
+                self._rebuild(index)
+            elif version != index.version:
+                index.version = version
+                index.dirty = True
+            if self.path and index.merge_threshold and index.pending_size > index.merge_threshold:
+                index.save(self.path)
+        if self.on_change:
+            self.on_change()
+
+    def _save(self, index):
+        with index._lock:
+            if index.dirty and not index.needs_rebuild:
+                index.save(self.path)
+
+    # Индекс из файла (если он есть и читается) или построенный заново
+    def open(self):
+        index = None
+        if self.path and os.path.exists(self.path):
+            try:
+                index = self.index_class.load(self.path)
+            except (OSError, ValueError, KeyError):
+                pass
+        if index is None:
+            index = self.index_class()
+            self._rebuild(index)
+        else:
+            self._catch_up(index)
+        if self.path:
+            atexit.register(self._save, index)
+        return index
+
+    # Индекс, догнавший текущее поколение данных
+    def ready(self, index):
+        if index.version < data_generation():
+            with index._lock:
+                if index.version < data_generation():
+                    self._catch_up(index)
+        return index
+
+# Вызов с замером времени для метрик (индексы не кэшируют результат)
+def timed(name, compute):
+    started = time.perf_counter()
+    result = compute()
+    get_metrics().record_call(name, (time.perf_counter() - started) * 1000, hit=False)
+    return result
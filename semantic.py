@@ -0,0 +1,268 @@
+import functools
+import os
+import re
+from collections import Counter
+
+import numpy as np
+import streamlit as st
+
+from db import DB_FILE
+from question_index import IndexKeeper, QuestionIndex, timed
+
+# Локальный поиск похожих вопросов: TF-IDF по вопросу, ответу и
+# дополнительной информации, косинусная близость считается в NumPy.
+# Никаких сетевых моделей — индекс строится из таблицы questions.
+
+# Файл индекса лежит рядом с базой
+INDEX_FILE = os.path.splitext(DB_FILE)[0] + ".tfidf.npz"
+
+# Минимальная близость, при которой вопрос считается похожим
+MIN_SCORE = 0.1
+
+# Слова вопроса весят больше, чем слова ответа
+QUESTION_WEIGHT = 2
+
+# Новые строки копятся отдельно и вливаются в матрицу пачкой
+MERGE_THRESHOLD = 50000
+
+# ===== Нормализация русского текста =====
+WORD_RE = re.compile(r"[0-9a-zа-я]+")
+
+STOP_WORDS = frozenset("""
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по
+    только ее мне было вот от меня еще нет о из ему теперь когда даже ну ли если уже
+    или ни быть был него до вас нибудь уж вам ведь там потом себя ничего ей может они
+    тут где есть надо ней для мы тебя их чем была сам чтобы без чего раз тоже себе под
+    будет ж тогда кто этот того потому этого какой ним здесь этом один мой тем нее
+    были куда зачем всех можно при об другой хоть после над больше тот через эти нас
+    про всего них какая много три эту моя свою этой перед том нельзя такой им более
+    всегда между это
+""".split())
+
+# Короче этого основа слова не обрезается
+MIN_STEM = 3
+
+# Окончания, которые отрезаем (самые длинные проверяются первыми)
+ENDINGS = sorted("""
+    ться ешься ется ются ится ятся ами ями ого его ому ему ыми ими ать ять ить еть уть
+    ала ила ыла ела али или ыли ели ешь ишь ает яет ует ают яют уют ых их
+    ой ей ий ый ая яя ое ее ам ям ах ях ом ем ов ев ую юю ию ия ие ии ть ся сь ет ут ют
+    ит ат ят ла ло ли а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+
+# Словарь базы невелик, поэтому основы слов запоминаются
+@functools.lru_cache(maxsize=65536)
+def stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+def tokenize(text):
+    if not text:
+        return []
+    words = WORD_RE.findall(text.lower().replace("ё", "е"))
+    return [stem(word) for word in words if len(word) > 1 and word not in STOP_WORDS]
+
+def document_terms(question, answer, info):
+    return tokenize(question) * QUESTION_WEIGHT + tokenize(answer) + tokenize(info)
+
+def _sublinear(counts):
+    return 1.0 + np.log(counts)
+
+# ===== Индекс =====
+# Матрица хранится по столбцам (CSC): для каждого термина — строки документов
+# и веса. Запрос затрагивает только столбцы своих терминов, поэтому его цена
+# зависит от длины этих списков, а не от размера базы. Удаления и правки
+# не уменьшают частоты терминов — их исправляет перестройка индекса.
+class SemanticIndex(QuestionIndex):
+    merge_threshold = MERGE_THRESHOLD
+
+    def _reset(self):
+        super()._reset()
+        self.vocabulary = {}
+        self.doc_freq = np.zeros(0, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.col_ptr = np.zeros(1, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.pending_rows = []
+        self.pending_cols = []
+        self.pending_weights = []
+
+    def _idf(self, cols):
+        return np.log((1 + self.size) / (1 + self.doc_freq[cols])) + 1.0
+
+    def _term_ids(self, terms, add=False):
+        ids = []
+        for term in terms:
+            col = self.vocabulary.get(term)
+            if col is None:
+                if not add:
+                    continue
+                col = self.vocabulary[term] = len(self.vocabulary)
+            ids.append(col)
+        return ids
+
+    # Вектор документа или запроса: (столбцы, нормированные веса)
+    def _vector(self, cols):
+        counts = Counter(cols)
+        cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        weights = _sublinear(tf) * self._idf(cols)
+        norm = np.sqrt(np.dot(weights, weights))
+        return cols, (weights / norm if norm else weights)
+
+    # ----- Построение и сохранение -----
+    def build(self, documents):
+        with self._lock:
+            self._reset()
+            doc_ids, rows, cols, counts = [], [], [], []
+            for question_id, question, answer, info in documents:
+                terms = Counter(self._term_ids(document_terms(question, answer, info), add=True))
+                row = len(doc_ids)
+                doc_ids.append(question_id)
+                self.row_of[question_id] = row
+                rows.extend([row] * len(terms))
+                cols.extend(terms.keys())
+                counts.extend(terms.values())
+
+            rows = np.asarray(rows, dtype=np.int32)
+            cols = np.asarray(cols, dtype=np.int64)
+            self.doc_ids = np.asarray(doc_ids, dtype=np.int64)
+            self.alive = np.ones(len(doc_ids), dtype=bool)
+            self.doc_freq = np.bincount(cols, minlength=len(self.vocabulary)).astype(np.int64)
+
+            weights = _sublinear(np.asarray(counts, dtype=np.float64)) * self._idf(cols)
+            norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=len(doc_ids)))
+            weights /= np.where(norms > 0, norms, 1.0)[rows]
+            self._set_matrix(rows, cols, weights)
+            self.dirty = True
+
+    def _set_matrix(self, rows, cols, weights):
+        order = np.argsort(cols, kind="stable")
+        self.rows = rows[order].astype(np.int32)
+        self.weights = weights[order].astype(np.float32)
+        self.col_ptr = np.concatenate(([0], np.cumsum(np.bincount(cols, minlength=len(self.vocabulary)))))
+
+    # Вливаем накопленные новые строки в основную матрицу
+    def merge(self):
+        with self._lock:
+            if not self.pending_rows:
+                return
+            main_cols = np.repeat(np.arange(len(self.col_ptr) - 1), np.diff(self.col_ptr))
+            self._set_matrix(
+                np.concatenate([self.rows] + self.pending_rows),
+                np.concatenate([main_cols] + self.pending_cols),
+                np.concatenate([self.weights] + self.pending_weights),
+            )
+            self.pending_rows, self.pending_cols, self.pending_weights = [], [], []
+
+    def save(self, path):
+        with self._lock:
+            self.merge()
+            terms = sorted(self.vocabulary, key=self.vocabulary.get)
+            # Пишем во временный файл и подменяем: файл читают и пишут другие процессы
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                np.savez(
+                    f,
+                    terms=np.array(terms, dtype=str),
+                    doc_freq=self.doc_freq,
+                    doc_ids=self.doc_ids,
+                    alive=self.alive,
+                    col_ptr=self.col_ptr,
+                    rows=self.rows,
+                    weights=self.weights,
+                    version=np.asarray(self.version, dtype=np.int64),
+                )
+            os.replace(temp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with np.load(path) as data:
+            index.vocabulary = {term: col for col, term in enumerate(data["terms"].tolist())}
+            index.doc_freq = data["doc_freq"]
+            index.doc_ids = data["doc_ids"]
+            index.alive = data["alive"]
+            index.col_ptr = data["col_ptr"]
+            index.rows = data["rows"]
+            index.weights = data["weights"]
+            index.version = int(data["version"])
+        index.row_of = {int(question_id): row
+                        for row, question_id in enumerate(index.doc_ids.tolist()) if index.alive[row]}
+        return index
+
+    # ----- Инкрементальные изменения -----
+    def add(self, question_id, question, answer, info):
+        with self._lock:
+            self.remove(question_id)
+            terms = self._term_ids(document_terms(question, answer, info), add=True)
+            if len(self.doc_freq) < len(self.vocabulary):
+                self.doc_freq = np.concatenate(
+                    (self.doc_freq, np.zeros(len(self.vocabulary) - len(self.doc_freq), dtype=np.int64)))
+            row = len(self.doc_ids)
+            self.doc_ids = np.append(self.doc_ids, question_id)
+            self.alive = np.append(self.alive, True)
+            self.row_of[question_id] = row
+            self.dirty = True
+            if not terms:
+                return
+            self.doc_freq[np.unique(terms)] += 1
+            cols, weights = self._vector(terms)
+            self.pending_rows.append(np.full(len(cols), row, dtype=np.int32))
+            self.pending_cols.append(cols)
+            self.pending_weights.append(weights.astype(np.float32))
+
+    @property
+    def pending_size(self):
+        return sum(len(rows) for rows in self.pending_rows)
+
+    # ----- Поиск -----
+    # Возвращает список (question_id, близость) по убыванию близости
+    def query(self, text, limit=20, min_score=MIN_SCORE):
+        with self._lock:
+            cols = self._term_ids(tokenize(text))
+            if not cols or not self.size:
+                return []
+            cols, query_weights = self._vector(cols)
+
+            scores = np.zeros(len(self.doc_ids), dtype=np.float64)
+            main_cols = len(self.col_ptr) - 1
+            hit_rows, hit_weights = [], []
+            for col, weight in zip(cols.tolist(), query_weights.tolist()):
+                if col < main_cols:
+                    start, end = self.col_ptr[col], self.col_ptr[col + 1]
+                    hit_rows.append(self.rows[start:end])
+                    hit_weights.append(self.weights[start:end] * weight)
+            if hit_rows:
+                scores += np.bincount(np.concatenate(hit_rows), weights=np.concatenate(hit_weights),
+                                      minlength=len(scores))
+
+            # Новые строки, ещё не влитые в матрицу
+            if self.pending_rows:
+                pending_cols = np.concatenate(self.pending_cols)
+                query_dense = np.zeros(len(self.vocabulary))
+                query_dense[cols] = query_weights
+                contribution = np.concatenate(self.pending_weights) * query_dense[pending_cols]
+                scores += np.bincount(np.concatenate(self.pending_rows), weights=contribution,
+                                      minlength=len(scores))
+
+            scores[~self.alive] = 0
+            limit = min(limit, len(scores))
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            top = top[np.argsort(-scores[top])]
+            return [(int(self.doc_ids[row]), float(scores[row])) for row in top if scores[row] >= min_score]
+
+# ===== Индекс процесса =====
+_keeper = IndexKeeper(SemanticIndex, "SELECT id, question, answer, info FROM questions ORDER BY id", INDEX_FILE)
+
+@st.cache_resource(show_spinner="Готовим поиск похожих вопросов...")
+def get_semantic_index():
+    return _keeper.open()
+
+def similar_questions(text, limit=20):
+    return timed("similar_questions", lambda: _keeper.ready(get_semantic_index()).query(text, limit))
@@ -0,0 +1,152 @@
+// Поиск по статической копии базы знаний (static_site.py). Индекс search.json
+// загружается при первом запросе; слова разбираются по правилам из индекса,
+// так же как semantic.tokenize на сервере.
+(function () {
+  const WORD_RE = /[0-9a-zа-я]+/g;
+  const RESULTS_SHOWN = 50;
+  const INPUT_DELAY_MS = 150;
+
+  let indexPromise = null;
+
+  function loadIndex() {
+    if (!indexPromise) {
+      indexPromise = fetch("search.json")
+        .then((response) => response.json())
+        .then(prepare);
+    }
+    return indexPromise;
+  }
+
+  // Списки вопросов хранятся разностями соседних номеров
+  function prepare(index) {
+    index.stopWords = new Set(index.normalization.stop_words);
+    index.postings = index.postings.map((gaps) => {
+      let doc = 0;
+      return gaps.map((gap) => (doc += gap));
+    });
+    return index;
+  }
+
+  function stem(index, word) {
+    const { endings, min_stem: minStem } = index.normalization;
+    for (const ending of endings) {
+      if (word.endsWith(ending) && word.length - ending.length >= minStem) {
+        return word.slice(0, -ending.length);
+      }
+    }
+    return word;
+  }
+
+  function tokenize(index, text) {
+    const words = text.toLowerCase().replaceAll("ё", "е").match(WORD_RE) || [];
+    return words
+      .filter((word) => word.length > 1 && !index.stopWords.has(word))
+      .map((word) => stem(index, word));
+  }
+
+  // Позиция первого термина словаря, не меньшего term
+  function lowerBound(terms, term) {
+    let low = 0;
+    let high = terms.length;
+    while (low < high) {
+      const middle = (low + high) >> 1;
+      if (terms[middle] < term) {
+        low = middle + 1;
+      } else {
+        high = middle;
+      }
+    }
+    return low;
+  }
+
+  // Вопросы с термином; последнее слово запроса ищется как префикс
+  function documents(index, term, prefix) {
+    const found = new Set();
+    for (let i = lowerBound(index.terms, term); i < index.terms.length; i++) {
+      const candidate = index.terms[i];
+      if (candidate !== term && !(prefix && candidate.startsWith(term))) {
+        break;
+      }
+      index.postings[i].forEach((doc) => found.add(doc));
+    }
+    return found;
+  }
+
+  // Основа с окончанием тоже ищется без него: «сертификаты» даёт
+  // «сертификат», а в тексте «сертификат» уже сведён к «сертифик»
+  function variants(index, term) {
+    const found = [term];
+    for (let next = stem(index, term); next !== term; next = stem(index, next)) {
+      found.push((term = next));
+    }
+    return found;
+  }
+
+  // Сначала вопросы, где нашлось больше слов запроса
+  function search(index, text) {
+    const terms = tokenize(index, text);
+    const scores = new Map();
+    terms.forEach((term, position) => {
+      const found = new Set();
+      for (const variant of variants(index, term)) {
+        documents(index, variant, position === terms.length - 1).forEach((doc) => found.add(doc));
+      }
+      found.forEach((doc) => {
+        scores.set(doc, (scores.get(doc) || 0) + 1);
+      });
+    });
+    return [...scores]
+      .sort((first, second) => second[1] - first[1] || first[0] - second[0])
+      .slice(0, RESULTS_SHOWN)
+      .map(([doc]) => doc);
+  }
+
+  function render(index, docs, container) {
+    container.replaceChildren();
+    if (!docs.length) {
+      container.textContent = "Ничего не найдено";
+      return;
+    }
+    const list = document.createElement("ol");
+    for (const doc of docs) {
+      const [sectionIndex, questionId, title] = index.docs[doc];
+      const [file, sectionTitle] = index.sections[sectionIndex];
+      const link = document.createElement("a");
+      link.href = `${file}#q${questionId}`;
+      link.textContent = `📁 ${sectionTitle} » ${title}`;
+      const item = document.createElement("li");
+      item.append(link);
+      list.append(item);
+    }
+    container.append(list);
+  }
+
+  // Ссылка вида section-1.html#q42 раскрывает вопрос
+  function openFromHash() {
+    const target = location.hash && document.getElementById(location.hash.slice(1));
+    if (target && target.tagName === "DETAILS") {
+      target.open = true;
+      target.scrollIntoView();
+    }
+  }
+
+  document.addEventListener("DOMContentLoaded", () => {
+    openFromHash();
+    window.addEventListener("hashchange", openFromHash);
+
+    const input = document.getElementById("search-input");
+    const container = document.getElementById("search-results");
+    let timer = null;
+    input.addEventListener("input", () => {
+      clearTimeout(timer);
+      timer = setTimeout(async () => {
+        if (!input.value.trim()) {
+          container.replaceChildren();
+          return;
+        }
+        const index = await loadIndex();
+        render(index, search(index, input.value), container);
+      }, INPUT_DELAY_MS);
+    });
+  });
+})();
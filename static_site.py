@@ -0,0 +1,265 @@
+# Статическая копия базы знаний: по странице на раздел, страница со списком
+# разделов и готовый индекс для поиска в браузере (search.json + search.js).
+# Такой сайт отдаёт любой статический веб-сервер — без Streamlit и SQLite.
+#
+#   python static_site.py --out site
+#   KNOWLEDGE_DB=/data/knowledge.db python static_site.py --out /var/www/kb
+#
+# Повторная сборка перерисовывает только разделы, изменившиеся с прошлой:
+# время изменения раздела и его вопросов ведут триггеры (section_stats.updated_at).
+# Части поискового индекса хранятся по разделам и при сборке только склеиваются.
+import argparse
+import html
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+# Из командной строки: без сервера Streamlit кэши db предупреждают при импорте
+if __name__ == "__main__":
+    from benchmark import QUIET_LOGGERS
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).disabled = True
+
+from db import TITLE_LENGTH, read_connection
+from semantic import ENDINGS, MIN_STEM, STOP_WORDS, tokenize
+
+# Каталог сайта для кнопки в админке (если задан)
+SITE_DIR = os.environ.get("KNOWLEDGE_SITE_DIR")
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "site_assets")
+ASSETS = ("search.js", "style.css")
+
+MANIFEST_FILE = "manifest.json"
+SEARCH_FILE = "search.json"
+PARTS_DIR = "_parts"
+
+# Версия формата; при смене сайт пересобирается целиком
+SITE_FORMAT = 1
+
+def section_file(section_id):
+    return f"section-{section_id}.html"
+
+def _part_file(out_dir, section_id):
+    return os.path.join(out_dir, PARTS_DIR, f"section-{section_id}.json")
+
+# Пишем во временный файл и подменяем: сайт могут отдавать прямо во время сборки.
+# Имя временного файла своё у каждой записи — сборки из админки и из командной
+# строки могут идти одновременно
+def _write(path, text):
+    fd, temp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.",
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        # mkstemp создаёт файл только для владельца, а сайт читает веб-сервер
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def _write_json(path, data):
+    _write(path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+
+# Скрипт и стили копируются, только если отличаются от уже лежащих на сайте
+def _copy_asset(name, out_dir):
+    source, target = os.path.join(ASSETS_DIR, name), os.path.join(out_dir, name)
+    with open(source, "rb") as f:
+        content = f.read()
+    if os.path.exists(target):
+        with open(target, "rb") as f:
+            if f.read() == content:
+                return
+    shutil.copyfile(source, target)
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("format") == SITE_FORMAT else {}
+
+# ===== Страницы =====
+def _text(value):
+    return html.escape(value) if value else "—"
+
+def _page(title, body):
+    return f"""<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{html.escape(title)}</title>
+<link rel="stylesheet" href="style.css">
+<script src="search.js" defer></script>
+</head>
+<body>
+<header>
+<a class="home" href="index.html">📚 База знаний</a>
+<input id="search-input" type="search" placeholder="🔍 Поиск по базе знаний..." autocomplete="off">
+<div id="search-results"></div>
+</header>
+<main>
+{body}
+</main>
+</body>
+</html>
+"""
+
+def render_index(sections, built_at):
+    items = []
+    for section_id, title, description, question_count, _ in sections:
+        items.append(f'<li><a href="{section_file(section_id)}">📁 {html.escape(title)}</a> '
+                     f'<span class="meta">Вопросов: {question_count}</span>'
+                     + (f'<p class="description">{html.escape(description)}</p>' if description else "")
+                     + "</li>")
+    body = ('<h1>📂 Разделы</h1>\n<ul class="sections">\n' + "\n".join(items) + "\n</ul>\n"
+            f'<p class="meta">Обновлено: {html.escape(built_at)} (UTC)</p>')
+    return _page("База знаний", body)
+
+def render_section(section, questions):
+    section_id, title, description, question_count, _ = section
+    blocks = []
+    for question_id, question, answer, info in questions:
+        blocks.append(f"""<details id="q{question_id}">
+<summary>❓ {html.escape(question[:TITLE_LENGTH])}</summary>
+<h3>Вопрос / Ситуация</h3>
+<div class="text">{_text(question)}</div>
+<h3>Ответ / Действия</h3>
+<div class="text">{_text(answer)}</div>
+<h3>Дополнительно</h3>
+<div class="text">{_text(info)}</div>
+</details>""")
+    body = (f'<p><a href="index.html">← Назад к разделам</a></p>\n<h1>{html.escape(title)}</h1>\n'
+            + (f'<p class="description">{html.escape(description)}</p>\n' if description else "")
+            + f'<p class="meta">Вопросов: {question_count}</p>\n'
+            + ("\n".join(blocks) if blocks else "<p>В этом разделе пока нет вопросов.</p>"))
+    return _page(title, body)
+
+# ===== Поисковый индекс =====
+# Часть индекса одного раздела: заголовки вопросов и для каждой основы
+# слова — номера вопросов внутри раздела
+def build_part(questions):
+    terms = defaultdict(list)
+    for position, (_, question, answer, info) in enumerate(questions):
+        for term in sorted(set(tokenize(question) + tokenize(answer) + tokenize(info))):
+            terms[term].append(position)
+    return {"docs": [[question_id, question[:TITLE_LENGTH]] for question_id, question, _, _ in questions],
+            "terms": terms}
+
+# Общий индекс из частей разделов. Словарь отсортирован (поиск по префиксу
+# двоичным поиском), списки вопросов хранятся разностями соседних номеров.
+# Правила нормализации лежат в самом индексе, чтобы браузер разбирал запрос
+# так же, как semantic.tokenize.
+def build_search_index(sections, parts):
+    docs, postings = [], defaultdict(list)
+    for section_index, (section, part) in enumerate(zip(sections, parts)):
+        base = len(docs)
+        docs.extend([section_index, question_id, title] for question_id, title in part["docs"])
+        for term, positions in part["terms"].items():
+            postings[term].extend(base + position for position in positions)
+
+    terms = sorted(postings)
+    encoded = []
+    for term in terms:
+        gaps, previous = [], 0
+        for doc in postings[term]:
+            gaps.append(doc - previous)
+            previous = doc
+        encoded.append(gaps)
+    return {
+        "format": SITE_FORMAT,
+        "normalization": {"stop_words": sorted(STOP_WORDS), "endings": ENDINGS, "min_stem": MIN_STEM},
+        "sections": [[section_file(section[0]), section[1]] for section in sections],
+        "docs": docs,
+        "terms": terms,
+        "postings": encoded,
+    }
+
+# ===== Сборка =====
+# Раздел перерисовывается, если он новый, его страницы нет или он менялся
+# после прошлой сборки. Время в SQLite с точностью до секунды, поэтому
+# изменения в ту же секунду, что и прошлая сборка, тоже считаются новыми.
+def _is_changed(out_dir, section, previous, last_built):
+    section_id, _, _, _, updated_at = section
+    entry = previous.get(str(section_id))
+    return (entry is None
+            or entry["updated_at"] != updated_at
+            or updated_at is None
+            or (last_built is not None and updated_at >= last_built)
+            or not os.path.exists(os.path.join(out_dir, section_file(section_id)))
+            or not os.path.exists(_part_file(out_dir, section_id)))
+
+# Возвращает (перерисовано разделов, всего разделов, удалено разделов)
+def build_site(out_dir, force=False):
+    os.makedirs(os.path.join(out_dir, PARTS_DIR), exist_ok=True)
+    manifest = {} if force else _load_manifest(out_dir)
+    previous = manifest.get("sections", {})
+
+    with read_connection() as conn:
+        # Вся сборка видит одно состояние базы
+        conn.execute("BEGIN")
+        built_at = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+        sections = conn.execute("""
+            SELECT s.id, s.title, s.description, st.question_count, st.updated_at
+            FROM sections s
+            JOIN section_stats st ON st.section_id = s.id
+            ORDER BY s.title, s.id
+        """).fetchall()
+        changed = [section for section in sections
+                   if _is_changed(out_dir, section, previous, manifest.get("built_at"))]
+        for section in changed:
+            questions = conn.execute("""
+                SELECT id, question, answer, info FROM questions WHERE section_id = ? ORDER BY id
+            """, (section[0],)).fetchall()
+            _write(os.path.join(out_dir, section_file(section[0])), render_section(section, questions))
+            _write_json(_part_file(out_dir, section[0]), build_part(questions))
+
+    # Страницы удалённых разделов
+    current = {str(section[0]) for section in sections}
+    removed = [section_id for section_id in previous if section_id not in current]
+    for section_id in removed:
+        _remove(os.path.join(out_dir, section_file(section_id)))
+        _remove(_part_file(out_dir, section_id))
+
+    if changed or removed or not manifest or not os.path.exists(os.path.join(out_dir, SEARCH_FILE)):
+        parts = []
+        for section in sections:
+            with open(_part_file(out_dir, section[0]), encoding="utf-8") as f:
+                parts.append(json.load(f))
+        _write_json(os.path.join(out_dir, SEARCH_FILE), build_search_index(sections, parts))
+        _write(os.path.join(out_dir, "index.html"), render_index(sections, built_at))
+    for asset in ASSETS:
+        _copy_asset(asset, out_dir)
+
+    # Манифест пишется последним: если сборка прервётся, следующая повторит её
+    _write_json(os.path.join(out_dir, MANIFEST_FILE), {
+        "format": SITE_FORMAT,
+        "built_at": built_at,
+        "sections": {str(section_id): {"title": title, "updated_at": updated_at}
+                     for section_id, title, _, _, updated_at in sections},
+    })
+    return len(changed), len(sections), len(removed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Статическая копия базы знаний с поиском в браузере")
+    parser.add_argument("--out", default=SITE_DIR or "site", help="каталог сайта")
+    parser.add_argument("--force", action="store_true", help="перерисовать все разделы")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rendered, total, removed = build_site(args.out, force=args.force)
+    print(f"Перерисовано разделов: {rendered} из {total}, удалено: {removed} "
+          f"за {time.perf_counter() - started:.1f} с → {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+import streamlit as st
+from cachetools import LRUCache
+
+from db import TITLE_LENGTH, build_fts_query, data_generation, read_connection
+from metrics import get_metrics
+from question_index import IndexKeeper, QuestionIndex
+from semantic import STOP_WORDS, WORD_RE
+
+# Подсказки по заголовкам вопросов, пока пользователь набирает запрос.
+# Слова заголовков лежат в отсортированном словаре (поиск по префиксу
+# через bisect) и в индексе триграмм (исправление опечаток). Для каждого
+# слова хранится список строк индекса, где оно встречается.
+
+# Сколько подсказок показывать
+SUGGEST_LIMIT = 8
+
+# Короче этого префикс не раскрываем
+MIN_PREFIX = 2
+
+# Сколько самых частых слов берём для одного префикса
+PREFIX_EXPANSION = 64
+
+# Опечатки: сколько похожих слов брать и насколько они должны совпадать
+# по триграммам (коэффициент Дайса); такое совпадение весит меньше точного
+TYPO_CANDIDATES = 3
+TYPO_MIN_SIMILARITY = 0.5
+TYPO_WEIGHT = 0.7
+
+# Сколько последних запросов с результатами помнить
+RESULT_CACHE_SIZE = 1024
+
+def title_words(text):
+    if not text:
+        return []
+    return WORD_RE.findall(text.lower().replace("ё", "е"))
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SuggestIndex(QuestionIndex):
+    def _reset(self):
+        super()._reset()
+        self.words = []                        # словарь, отсортирован
+        self.doc_freq = Counter()              # слово -> число заголовков
+        self.trigram_words = defaultdict(set)  # триграмма -> слова
+        self.postings = {}                     # слово -> np.array строк
+        self.pending = defaultdict(list)       # слово -> новые строки
+        self.doc_ids = []
+        self.alive = np.zeros(0, dtype=bool)
+
+    @staticmethod
+    def _fields(question, answer, info):
+        return (question[:TITLE_LENGTH],)
+
+    def _add_word(self, word):
+        if word not in self.doc_freq:
+            bisect.insort(self.words, word)
+            for trigram in trigrams(word):
+                self.trigram_words[trigram].add(word)
+        self.doc_freq[word] += 1
+
+    @staticmethod
+    def _index_words(title):
+        # Последнее слово обрезанного заголовка может быть недописанным
+        if len(title) >= TITLE_LENGTH:
+            title = title.rsplit(None, 1)[0]
+        return {word for word in title_words(title) if len(word) > 1 and word not in STOP_WORDS}
+
+    def build(self, rows):
+        with self._lock:
+            self._reset()
+            postings = defaultdict(list)
+            for row, (question_id, title) in enumerate(rows):
+                self.doc_ids.append(question_id)
+                self.row_of[question_id] = row
+                for word in self._index_words(title):
+                    postings[word].append(row)
+            self.doc_freq = Counter({word: len(word_rows) for word, word_rows in postings.items()})
+            self.words = sorted(postings)
+            for word in self.words:
+                for trigram in trigrams(word):
+                    self.trigram_words[trigram].add(word)
+            self.postings = {word: np.asarray(word_rows, dtype=np.int32) for word, word_rows in postings.items()}
+            self.alive = np.ones(len(self.doc_ids), dtype=bool)
+
+    # ----- Инкрементальные изменения -----
+    def add(self, question_id, title):
+        with self._lock:
+            self.remove(question_id)
+            row = len(self.doc_ids)
+            self.doc_ids.append(question_id)
+            self.alive = np.append(self.alive, True)
+            self.row_of[question_id] = row
+            for word in self._index_words(title):
+                self._add_word(word)
+                self.pending[word].append(row)
+
+    # ----- Поиск -----
+    # Слова словаря, подходящие к слову запроса, с весами:
+    # само слово и слова с этим префиксом — 1, похожие по триграммам — меньше
+    def candidates(self, term):
+        if len(term) < MIN_PREFIX:
+            return []
+        start = bisect.bisect_left(self.words, term)
+        end = bisect.bisect_left(self.words, term + "\uffff", start)
+        if start < end:
+            matches = self.words[start:end]
+            if len(matches) > PREFIX_EXPANSION:
+                matches = heapq.nlargest(PREFIX_EXPANSION, matches, key=self.doc_freq.__getitem__)
+            return [(word, 1.0) for word in matches]
+        return [(word, TYPO_WEIGHT * similarity) for word, similarity in self.corrections(term)]
+
+    def corrections(self, term):
+        term_trigrams = trigrams(term)
+        shared = Counter()
+        for trigram in term_trigrams:
+            shared.update(self.trigram_words.get(trigram, ()))
+        scored = []
+        for word, count in shared.items():
+            similarity = 2 * count / (len(term_trigrams) + len(trigrams(word)))
+            if similarity >= TYPO_MIN_SIMILARITY:
+                scored.append((similarity, self.doc_freq[word], word))
+        return [(word, similarity) for similarity, _, word in heapq.nlargest(TYPO_CANDIDATES, scored)]
+
+    # Лучшие заголовки для набираемого текста: последнее слово считается
+    # недописанным префиксом. Сначала заголовки, где нашлись все слова.
+    def query(self, text, limit=SUGGEST_LIMIT):
+        terms = title_words(text)
+        terms = [term for position, term in enumerate(terms)
+                 if position == len(terms) - 1 or term not in STOP_WORDS]
+        with self._lock:
+            if not terms or not len(self.doc_ids):
+                return []
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+            for term in terms:
+                term_scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+                for word, weight in self.candidates(term):
+                    for rows in (self.postings.get(word), self.pending.get(word)):
+                        if rows is not None and len(rows):
+                            term_scores[rows] = np.maximum(term_scores[rows], weight)
+                scores += term_scores
+            scores[~self.alive] = 0
+            found = np.flatnonzero(scores)
+            if not len(found):
+                return []
+            # При равенстве выше старые вопросы: порядок стабилен между перезапусками
+            top = found[np.argsort(-scores[found], kind="stable")[:limit]]
+            return [(int(self.doc_ids[row]), float(scores[row]) / len(terms)) for row in top]
+
+    # Запрос с исправленными опечатками или None, если исправлять нечего.
+    # known(word) — слово находится и без исправления, его не трогаем
+    def correct(self, text, known=lambda word: False):
+        words = title_words(text)
+        corrected = []
+        with self._lock:
+            for word in words:
+                if word in self.doc_freq or word in STOP_WORDS or len(word) < MIN_PREFIX or known(word):
+                    corrected.append(word)
+                    continue
+                fixes = self.corrections(word)
+                corrected.append(fixes[0][0] if fixes else word)
+        return " ".join(corrected) if corrected != words else None
+
+# ===== Индекс процесса =====
+# Результаты недавних запросов; поколение данных входит в ключ,
+# а при изменении вопросов кэш очищается целиком
+_results = LRUCache(maxsize=RESULT_CACHE_SIZE)
+_results_lock = threading.Lock()
+
+def clear_results():
+    with _results_lock:
+        _results.clear()
+
+# Подсказки в файл не сохраняются — индекс строится заново при запуске
+_keeper = IndexKeeper(SuggestIndex, f"SELECT id, substr(question, 1, {TITLE_LENGTH}) FROM questions ORDER BY id",
+                      on_change=clear_results)
+
+@st.cache_resource(show_spinner="Готовим подсказки...")
+def get_suggest_index():
+    return _keeper.open()
+
+def _ready_index():
+    return _keeper.ready(get_suggest_index())
+
+def _cached(name, key, compute):
+    started = time.perf_counter()
+    key = (name, data_generation(), *key)
+    with _results_lock:
+        hit = key in _results
+        if hit:
+            result = _results[key]
+    if not hit:
+        result = compute()
+        with _results_lock:
+            _results[key] = result
+    get_metrics().record_call(name, (time.perf_counter() - started) * 1000, hit)
+    return result
+
+# [(question_id, score)] для набираемого текста, score от 0 до 1
+def suggest_questions(text, limit=SUGGEST_LIMIT):
+    text = " ".join(title_words(text))
+    return _cached("suggest_questions", (text, limit), lambda: _ready_index().query(text, limit))
+
+# Словарь подсказок знает только начала вопросов, а поиск идёт ещё по ответу
+# и дополнительной информации: слово, которое находит поиск, — не опечатка
+def _found_by_search(word):
+    with read_connection() as conn:
+        return conn.execute("SELECT 1 FROM questions_fts WHERE questions_fts MATCH ? LIMIT 1",
+                            (build_fts_query(word),)).fetchone() is not None
+
+def correct_query(text):
+    text = " ".join(title_words(text))
+    return _cached("correct_query", (text,), lambda: _ready_index().correct(text, _found_by_search))
@@ -0,0 +1,32 @@
+import sqlite3
+
+import pytest
+
+from db import build_fts_query, migrate
+
+@pytest.fixture
+def conn(tmp_path):
+    db_file = str(tmp_path / "knowledge.db")
+    migrate(db_file)
+    conn = sqlite3.connect(db_file)
+    conn.execute("INSERT INTO sections (title, description) VALUES ('Раздел', '')")
+    yield conn
+    conn.close()
+
+def _search(conn, text):
+    return conn.execute('''SELECT rowid, snippet(questions_fts, -1, '**', '**', '…', 16) FROM questions_fts
+                           WHERE questions_fts MATCH ?''', (build_fts_query(text),)).fetchall()
+
+# «е» и «ё» ищутся одинаково в обе стороны, а фрагмент показывает исходный текст
+def test_yo_is_folded(conn):
+    question_id = conn.execute("INSERT INTO questions (section_id, question, answer, info) "
+                               "VALUES (1, 'Ёлка и ежик', '', '')").lastrowid
+    assert _search(conn, "елка") == [(question_id, "**Ёлка** и ежик")]
+    assert _search(conn, "ЁЖИК") == [(question_id, "Ёлка и **ежик**")]
+
+    conn.execute("UPDATE questions SET question = 'Берёза' WHERE id = ?", (question_id,))
+    assert _search(conn, "елка") == []
+    assert _search(conn, "береза") == [(question_id, "**Берёза**")]
+
+    conn.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+    assert _search(conn, "берёза") == []
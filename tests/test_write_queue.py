@@ -0,0 +1,78 @@
+import sqlite3
+from concurrent.futures import Future
+
+import pytest
+
+from db import ConnectionPool, WriteQueue, _add_question, _add_section, migrate
+
+def _failing_operation(conn):
+    conn.execute("INSERT INTO sections (title, description) VALUES ('не сохранится', '')")
+    raise ValueError("ошибка операции")
+
+@pytest.fixture
+def pool(tmp_path):
+    db_file = str(tmp_path / "knowledge.db")
+    migrate(db_file)
+    return ConnectionPool(db_file)
+
+# Пачка применяется напрямую, чтобы все операции точно попали в одну
+def _apply(pool, *operations):
+    write_queue = WriteQueue(pool)
+    batch = []
+    for operation, *args in operations:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        batch.append((operation, args, future))
+    try:
+        write_queue._apply(batch)
+    except Exception:
+        pass
+    write_queue.close()
+    return [future for _, _, future in batch]
+
+def _rows(pool, query):
+    conn = sqlite3.connect(pool.db_file)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+# Пачка — одна транзакция: одна фиксация, поколение растёт вместе с данными,
+# упавшая операция откатывается до своей точки сохранения
+def test_batch_is_one_transaction(pool):
+    generation = pool.generation
+    statements = []
+    pool._writer.set_trace_callback(lambda statement: statements.append(statement.split()[0].upper()))
+    futures = _apply(pool,
+                     (_add_section, "Раздел", ""),
+                     (_failing_operation,),
+                     (_add_question, 1, "Вопрос", "Ответ", ""))
+
+    assert futures[0].result() is None
+    with pytest.raises(ValueError):
+        futures[1].result()
+    assert futures[2].result() == 1
+
+    # Точки сохранения вложены в транзакцию, а не открывают свои
+    assert statements[0] == "BEGIN" and statements[-1] == "COMMIT"
+    assert statements.count("BEGIN") == 1 and statements.count("COMMIT") == 1
+    assert pool.generation == generation + 1
+    assert _rows(pool, "SELECT title FROM sections") == [("Раздел",)]
+    assert _rows(pool, "SELECT COUNT(*) FROM questions") == [(1,)]
+    assert _rows(pool, "SELECT version FROM data_version") == [(pool.generation,)]
+
+# Ошибка при смене поколения откатывает всю пачку, и каждая операция получает ошибку
+def test_failed_commit_rolls_back_batch(pool):
+    generation = pool.generation
+    pool._writer.execute("CREATE TEMP TRIGGER fail_version BEFORE UPDATE ON main.data_version "
+                         "BEGIN SELECT RAISE(ABORT, 'нет записи'); END")
+    futures = _apply(pool,
+                     (_add_section, "Раздел", ""),
+                     (_add_question, 1, "Вопрос", "Ответ", ""))
+
+    for future in futures:
+        with pytest.raises(sqlite3.IntegrityError):
+            future.result()
+    assert pool.generation == generation
+    assert _rows(pool, "SELECT COUNT(*) FROM sections") == [(0,)]
+    assert _rows(pool, "SELECT COUNT(*) FROM questions") == [(0,)]
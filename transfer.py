@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from openpyxl import Workbook, load_workbook
+
+from db import read_connection, write_connection
+
+# Колонки файла обмена
+COLUMNS = ("section", "question", "answer", "info")
+
+# Русские заголовки колонок, которые тоже понимаем при импорте
+COLUMN_ALIASES = {
+    "раздел": "section",
+    "вопрос": "question",
+    "вопрос / ситуация": "question",
+    "ответ": "answer",
+    "ответ / действия": "answer",
+    "дополнительно": "info",
+}
+
+# Сколько строк вставляется за одну транзакцию
+IMPORT_BATCH_SIZE = 1000
+
+# Сколько строк читается из базы за один раз при экспорте
+EXPORT_BATCH_SIZE = 1000
+
+FORMATS = ("xlsx", "csv", "jsonl")
+
+MIME_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+def _column_name(header):
+    name = str(header or "").strip().lower()
+    return COLUMN_ALIASES.get(name, name)
+
+def _clean(value):
+    if value is None:
+        return ""
+    return str(value).strip()
+
+# ===== Чтение файлов (построчно, без загрузки целиком) =====
+def read_xlsx(file):
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_column_name(cell) for cell in next(rows, ())]
+        for row in rows:
+            yield dict(zip(header, row))
+    finally:
+        workbook.close()
+
+# Обёртка отсоединяется от файла в конце: иначе она закроет загруженный файл,
+# а вызывающему он ещё нужен (прогресс импорта читает позицию в нём)
+def read_csv(file):
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = [_column_name(cell) for cell in next(reader, [])]
+        for row in reader:
+            yield dict(zip(header, row))
+    finally:
+        text.detach()
+
+def read_jsonl(file):
+    text = io.TextIOWrapper(file, encoding="utf-8-sig")
+    try:
+        for line in text:
+            if line.strip():
+                yield {_column_name(key): value for key, value in json.loads(line).items()}
+    finally:
+        text.detach()
+
+READERS = {"xlsx": read_xlsx, "csv": read_csv, "jsonl": read_jsonl}
+
+def detect_format(filename):
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Неподдерживаемый формат файла: .{extension}")
+    return extension
+
+# ===== Импорт =====
+def _section_ids(conn):
+    # Названия разделов не уникальны — берём самый ранний раздел
+    rows = conn.execute("SELECT title, MIN(id) FROM sections GROUP BY title")
+    return {title: section_id for title, section_id in rows}
+
+# Импорт строк пачками: одна транзакция и один executemany на пачку.
+# Недостающие разделы создаются по ходу. progress(imported) вызывается после
+# каждой пачки. Возвращает (импортировано, пропущено, создано разделов).
+def import_rows(rows, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    with read_connection() as conn:
+        section_ids = _section_ids(conn)
+
+    imported = skipped = created = 0
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        values = []
+        with write_connection() as conn:
+            for row in batch:
+                section = _clean(row.get("section"))
+                question = _clean(row.get("question"))
+                if not section:
+                    skipped += 1
+                    continue
+                if section not in section_ids:
+                    cursor = conn.execute("INSERT INTO sections (title, description) VALUES (?, ?)",
+                                          (section, ""))
+                    section_ids[section] = cursor.lastrowid
+                    created += 1
+                # Строка без вопроса только создаёт раздел
+                if not question:
+                    continue
+                values.append((section_ids[section], question,
+                               _clean(row.get("answer")), _clean(row.get("info"))))
+            conn.executemany("INSERT INTO questions (section_id, question, answer, info) VALUES (?, ?, ?, ?)",
+                             values)
+        imported += len(values)
+        if progress:
+            progress(imported)
+    return imported, skipped, created
+
+def import_file(file, filename, progress=None):
+    return import_rows(READERS[detect_format(filename)](file), progress=progress)
+
+# ===== Экспорт =====
+# Все вопросы по разделам; пустые разделы выгружаются строкой без вопроса,
+# чтобы пережить повторный импорт
+def iter_export_rows(batch_size=EXPORT_BATCH_SIZE):
+    with read_connection() as conn:
+        cursor = conn.execute("""
+            SELECT s.title, q.question, q.answer, q.info
+            FROM sections s
+            LEFT JOIN questions q ON q.section_id = s.id
+            ORDER BY s.title, s.id, q.id
+        """)
+        while batch := cursor.fetchmany(batch_size):
+            for section, question, answer, info in batch:
+                yield section, question or "", answer or "", info or ""
+
+def write_xlsx(rows, out):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("База знаний")
+    sheet.append(COLUMNS)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(out)
+
+def write_csv(rows, out):
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+def write_jsonl(rows, out):
+    for row in rows:
+        line = json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False)
+        out.write(line.encode("utf-8") + b"\n")
+
+WRITERS = {"xlsx": write_xlsx, "csv": write_csv, "jsonl": write_jsonl}
+
+def export_to(out, fmt):
+    WRITERS[fmt](iter_export_rows(), out)
+
+def export_bytes(fmt):
+    out = io.BytesIO()
+    export_to(out, fmt)
+    return out.getvalue()